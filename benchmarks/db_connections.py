@@ -0,0 +1,95 @@
+"""Connection setup cost per request for the Postgres backend.
+
+Replays N simulated requests (request_started, SELECT 1, request_finished)
+against the configured default database in three modes:
+
+  fresh       CONN_MAX_AGE = 0, a new connection for every request
+  persistent  CONN_MAX_AGE > 0 with health checks
+  pool        psycopg 3 connection pool (OPTIONS['pool'])
+
+    python -m benchmarks.db_connections --requests 500
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.core import signals
+from django.db import connections
+
+
+def make_alias(name, **overrides):
+    settings_dict = copy.deepcopy(connections['default'].settings_dict)
+    settings_dict['OPTIONS'].pop('pool', None)
+    settings_dict.update(overrides)
+    connections.settings[name] = settings_dict
+    return name
+
+
+def run(alias, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        signals.request_started.send(sender=None)
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        signals.request_finished.send(sender=None)
+        timings.append((time.perf_counter() - start) * 1000)
+    connections[alias].close()
+    return timings
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': timings[len(timings) // 2],
+        'p95_ms': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    if connections['default'].vendor != 'postgresql':
+        parser.error('the default database is not PostgreSQL')
+
+    modes = {
+        'fresh': make_alias('bench_fresh', CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False),
+        'persistent': make_alias('bench_persistent', CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True),
+        'pool': make_alias('bench_pool', CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=True),
+    }
+    connections.settings['bench_pool']['OPTIONS']['pool'] = {'min_size': 1, 'max_size': 2}
+
+    results = {}
+    for mode, alias in modes.items():
+        run(alias, min(args.requests, 10))
+        results[mode] = summarize(run(alias, args.requests))
+    connections['bench_pool'].close_pool()
+
+    saved = results['fresh']['mean_ms'] - min(results['persistent']['mean_ms'], results['pool']['mean_ms'])
+    results['saved_per_request_ms'] = saved
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{"mode":<12}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}')
+    for mode in modes:
+        row = results[mode]
+        print(f'{mode:<12}{row["mean_ms"]:>10.3f}{row["p50_ms"]:>10.3f}{row["p95_ms"]:>10.3f}')
+    print(f'connection setup saved per request: {saved:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""In-process latency benchmark for every API endpoint.
+
+Creates a throwaway test database (SQLite by default, BENCH_DATABASE=postgres
+for the POSTGRES_* server), seeds it with benchmarks.seed and replays each
+router endpoint in habit/urls.py plus the djoser token login through
+Django's test client. Per endpoint it reports p50/p95/p99 latency,
+throughput, SQL queries per request and peak Python memory:
+
+    python -m benchmarks.load --users 5 --habits 200 --days 1825 --output before.json
+    python -m benchmarks.load --users 5 --habits 200 --days 1825 --compare before.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+django.setup()
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from benchmarks.seed import PASSWORD, seed
+from habit.models import Habit, DailyRecord
+
+MEMORY_RUNS = 3
+
+
+class Scenario:
+    # Request factories for one seeded user. Creates feed the pools the
+    # matching deletes drain; stock() tops a pool up before its delete runs.
+
+    def __init__(self, username, token):
+        self.username = username
+        self.client = Client(headers={'Authorization': f'Token {token}'})
+        self.anonymous = Client()
+        self.habit_ids = list(
+            Habit.objects.filter(user__username=username).order_by('id').values_list('id', flat=True)
+        )
+        self.record_ids = list(
+            DailyRecord.objects.filter(habit__user__username=username)
+            .order_by('-date', 'id').values_list('id', flat=True)[:1000]
+        )
+        self.counter = 0
+        self.created_habits = []
+        self.created_records = []
+
+    def next(self, items):
+        self.counter += 1
+        return items[self.counter % len(items)]
+
+    def next_day(self):
+        # Far before the seeded history, so creates never collide with it.
+        self.counter += 1
+        return (date(1900, 1, 1) + timedelta(days=self.counter)).isoformat()
+
+    def stock(self, pool, create, count):
+        # Untimed creates, so deletes also run alone or before their create.
+        while len(pool) < count:
+            create(self)
+
+    def json(self, method, path, data):
+        return getattr(self.client, method)(path, json.dumps(data), content_type='application/json')
+
+    def login(self):
+        return self.anonymous.post(
+            '/auth/token/login/',
+            json.dumps({'username': self.username, 'password': PASSWORD}),
+            content_type='application/json',
+        )
+
+    def habit_list(self):
+        return self.client.get(reverse('habit-list'))
+
+    def habit_list_fields(self):
+        return self.client.get(reverse('habit-list'), {'fields': 'id,name,success'})
+
+    def habit_detail(self):
+        return self.client.get(reverse('habit-detail', args=[self.next(self.habit_ids)]))
+
+    def habit_analytics(self):
+        return self.client.get(reverse('habit-analytics', args=[self.next(self.habit_ids)]))
+
+    def habit_series(self):
+        return self.client.get(reverse('habit-series', args=[self.next(self.habit_ids)]), {'bucket': 'week'})
+
+    def habit_series_list(self):
+        return self.client.get(reverse('habit-series-list'), {'bucket': 'month'})
+
+    def habit_due(self):
+        return self.client.get(reverse('habit-due'))
+
+    def habit_export(self):
+        return self.client.get(reverse('habit-export'), {'type': 'ndjson'})
+
+    def habit_create(self):
+        response = self.json('post', reverse('habit-list'), {
+            'name': 'Benchmark', 'description': 'Created by benchmarks.load', 'target': 10, 'unit': 'times',
+        })
+        self.created_habits.append(response.json()['id'])
+        return response
+
+    def habit_update(self):
+        return self.json('patch', reverse('habit-detail', args=[self.next(self.habit_ids)]), {'target': 10})
+
+    def habit_record_put(self):
+        habit_id = self.next(self.habit_ids)
+        return self.json('put', reverse('habit-record', args=[habit_id, date.today().isoformat()]), {
+            'amount_achieved': self.counter % 20,
+        })
+
+    def habit_record_increment(self):
+        habit_id = self.next(self.habit_ids)
+        return self.json('post', reverse('habit-record-increment', args=[habit_id, date.today().isoformat()]), {})
+
+    def habit_delete(self):
+        return self.client.delete(reverse('habit-detail', args=[self.created_habits.pop()]))
+
+    def record_list(self):
+        return self.client.get(reverse('dailyrecord-list'))
+
+    def record_detail(self):
+        return self.client.get(reverse('dailyrecord-detail', args=[self.next(self.record_ids)]))
+
+    def record_create(self):
+        response = self.json('post', reverse('dailyrecord-list'), {
+            'habit': self.habit_ids[0], 'date': self.next_day(), 'amount_achieved': 5,
+        })
+        self.created_records.append(response.json()['id'])
+        return response
+
+    def record_update(self):
+        return self.json('patch', reverse('dailyrecord-detail', args=[self.next(self.record_ids)]), {
+            'amount_achieved': self.counter % 50,
+        })
+
+    def record_delete(self):
+        return self.client.delete(reverse('dailyrecord-detail', args=[self.created_records.pop()]))
+
+    def record_bulk(self):
+        habit_id = self.next(self.habit_ids)
+        return self.json('post', reverse('dailyrecord-bulk'), [
+            {'habit': habit_id, 'date': self.next_day(), 'amount_achieved': day % 20}
+            for day in range(100)
+        ])
+
+    def record_import(self):
+        habit_id = self.next(self.habit_ids)
+        rows = ''.join(f'{habit_id},{self.next_day()},{day % 20}\n' for day in range(1000))
+        upload = ContentFile(f'habit,date,amount_achieved\n{rows}'.encode(), name='records.csv')
+        return self.client.post(reverse('dailyrecord-import'), {'file': upload})
+
+
+ENDPOINTS = {
+    'auth-token-login': Scenario.login,
+    'habit-list': Scenario.habit_list,
+    'habit-list-fields': Scenario.habit_list_fields,
+    'habit-detail': Scenario.habit_detail,
+    'habit-analytics': Scenario.habit_analytics,
+    'habit-series': Scenario.habit_series,
+    'habit-series-list': Scenario.habit_series_list,
+    'habit-due': Scenario.habit_due,
+    'habit-export': Scenario.habit_export,
+    'habit-create': Scenario.habit_create,
+    'habit-update': Scenario.habit_update,
+    'habit-delete': Scenario.habit_delete,
+    'habit-record-put': Scenario.habit_record_put,
+    'habit-record-increment': Scenario.habit_record_increment,
+    'dailyrecord-list': Scenario.record_list,
+    'dailyrecord-detail': Scenario.record_detail,
+    'dailyrecord-create': Scenario.record_create,
+    'dailyrecord-update': Scenario.record_update,
+    'dailyrecord-delete': Scenario.record_delete,
+    'dailyrecord-bulk': Scenario.record_bulk,
+    'dailyrecord-import': Scenario.record_import,
+}
+# Deletes and the pool and create request that supply their targets.
+TARGETS = {
+    'habit-delete': ('created_habits', Scenario.habit_create),
+    'dailyrecord-delete': ('created_records', Scenario.record_create),
+}
+
+
+def call(scenario, request):
+    response = request(scenario)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{request.__name__}: HTTP {response.status_code} {response.content[:200]!r}')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    response.close()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * pct / 100) - 1, 0)]
+
+
+def run_endpoint(scenario, request, requests, warmup):
+    for _ in range(warmup):
+        call(scenario, request)
+
+    timings = []
+    queries = []
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call(scenario, request)
+            timings.append(time.perf_counter() - start)
+        queries.append(len(captured))
+
+    # A separate pass: tracing allocations would distort the timings.
+    tracemalloc.start()
+    peak = 0
+    for _ in range(MEMORY_RUNS):
+        tracemalloc.reset_peak()
+        call(scenario, request)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'throughput_rps': len(timings) / sum(timings),
+        'queries': max(queries),
+        'peak_kib': peak / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print(f'\n{"endpoint":<24}{"p50 ms":>18}{"p95 ms":>18}{"queries":>12}')
+    for name, row in results['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (row[key] - old[key]) / old[key] * 100 if old[key] else 0
+            cells.append(f'{old[key]:.1f}->{row[key]:.1f} {change:+.0f}%')
+        print(f'{name:<24}{cells[0]:>18}{cells[1]:>18}{old["queries"]:>6}->{row["queries"]:<5}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--habits', type=int, default=50, help='habits per user')
+    parser.add_argument('--days', type=int, default=365, help='days of history per habit')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--endpoints', help='comma-separated subset of: ' + ', '.join(ENDPOINTS))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier --output')
+    args = parser.parse_args()
+
+    names = args.endpoints.split(',') if args.endpoints else list(ENDPOINTS)
+    unknown = set(names) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f'unknown endpoints: {", ".join(sorted(unknown))}')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        seeded = seed(args.users, args.habits, args.days, args.seed)
+        scenario = Scenario(seeded['users'][0], seeded['tokens'][0])
+        endpoints = {}
+        for name in names:
+            if name in TARGETS:
+                pool, create = TARGETS[name]
+                scenario.stock(getattr(scenario, pool), create, args.warmup + args.requests + MEMORY_RUNS)
+            endpoints[name] = run_endpoint(scenario, ENDPOINTS[name], args.requests, args.warmup)
+            row = endpoints[name]
+            print(
+                f'{name:<24}p50 {row["p50_ms"]:8.2f}  p95 {row["p95_ms"]:8.2f}  p99 {row["p99_ms"]:8.2f} ms'
+                f'  {row["throughput_rps"]:8.1f} req/s  {row["queries"]:3d} queries  {row["peak_kib"]:9.1f} KiB'
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(settings.BENCH_DIR, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'users': args.users,
+            'habits_per_user': args.habits,
+            'days': args.days,
+            'seed': args.seed,
+            'records': seeded['records'],
+            'requests': args.requests,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
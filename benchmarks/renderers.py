@@ -0,0 +1,120 @@
+"""Render/parse cost of the API content types.
+
+Builds payloads shaped like a habits/ page (habits with their daily_records
+window) and a daily-records/ page, then times DRF's stdlib JSONRenderer
+against the orjson and MessagePack renderers, plus the matching parsers:
+
+    python -m benchmarks.renderers --habits 100 --records 30 --repeat 200
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date, timedelta
+from io import BytesIO
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from habit.renderers import MessagePackParser, MessagePackRenderer, ORJSONParser, ORJSONRenderer
+
+CODECS = {
+    'json': (JSONRenderer(), JSONParser()),
+    'orjson': (ORJSONRenderer(), ORJSONParser()),
+    'msgpack': (MessagePackRenderer(), MessagePackParser()),
+}
+
+
+def habits_page(habits, records):
+    start = date(2024, 1, 1)
+    return {'next': None, 'previous': None, 'results': [
+        {
+            'id': habit_id,
+            'user': 'benchmark',
+            'name': f'Habit {habit_id}',
+            'description': 'Daily practice',
+            'target': 30,
+            'unit': 'minutes',
+            'daily_records': [
+                {'id': habit_id * records + day, 'date': start + timedelta(days=day), 'amount_achieved': day % 45}
+                for day in range(records)
+            ],
+            'total': records * 22,
+            'average': 22.0 + habit_id / 7,
+            'best': 44,
+            'success': habit_id % 2 == 0,
+        }
+        for habit_id in range(1, habits + 1)
+    ]}
+
+
+def records_page(count):
+    start = date(2024, 1, 1)
+    return {'next': None, 'previous': None, 'results': [
+        {
+            'id': record_id,
+            'habit': record_id % 50 + 1,
+            'date': (start + timedelta(days=record_id // 50)).isoformat(),
+            'amount_achieved': record_id % 45,
+            'target': 30,
+            'unit': 'minutes',
+        }
+        for record_id in range(count)
+    ]}
+
+
+def measure(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def bench(data, repeat):
+    results = {}
+    for name, (renderer, parser) in CODECS.items():
+        body = renderer.render(data)
+        results[name] = {
+            'render_ms': measure(lambda: renderer.render(data), repeat),
+            'parse_ms': measure(lambda: parser.parse(BytesIO(body)), repeat),
+            'bytes': len(body),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--habits', type=int, default=100)
+    parser.add_argument('--records', type=int, default=30, help='daily_records per habit')
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = {
+        'habits': bench(habits_page(args.habits, args.records), args.repeat),
+        'daily_records': bench(records_page(args.habits * args.records), args.repeat),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for payload, rows in results.items():
+        baseline = rows['json']
+        print(f'{payload}:')
+        print(f'  {"codec":<10}{"render ms":>11}{"parse ms":>11}{"bytes":>10}{"speedup":>9}')
+        for name, row in rows.items():
+            speedup = baseline['render_ms'] / row['render_ms']
+            print(
+                f'  {name:<10}{row["render_ms"]:>11.3f}{row["parse_ms"]:>11.3f}'
+                f'{row["bytes"]:>10}{speedup:>8.1f}x'
+            )
+
+
+if __name__ == '__main__':
+    main()
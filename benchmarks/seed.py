@@ -0,0 +1,106 @@
+"""Seeded data generator: N users x M habits x D days of records.
+
+The same --seed produces the same rows, with dates counting back from today.
+Used by benchmarks.load; run on its own it fills the configured database:
+
+    python -m benchmarks.seed --users 10 --habits 100 --days 1825 --seed 1
+"""
+import argparse
+import os
+import random
+from datetime import timedelta
+from io import StringIO
+from itertools import islice
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from habit.models import Habit, DailyRecord
+
+PASSWORD = 'benchmark-password'
+BATCH_SIZE = 5000
+UNITS = ['minutes', 'pages', 'times', 'km', 'glasses']
+
+
+def batches(items, size=BATCH_SIZE):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def generate_records(rng, habits, days, fill_rate):
+    today = timezone.localdate()
+    for habit in habits:
+        for day in range(days):
+            if rng.random() < fill_rate:
+                yield DailyRecord(
+                    habit_id=habit.pk,
+                    date=today - timedelta(days=day),
+                    amount_achieved=rng.randint(0, habit.target * 2),
+                )
+
+
+def seed(users, habits, days, seed=0, fill_rate=0.8, prefix='bench'):
+    # Bulk inserts skip the signal receivers, so success and HabitStats are
+    # rebuilt with the maintenance commands afterwards.
+    rng = random.Random(seed)
+    User = get_user_model()
+    password = make_password(PASSWORD)
+    created_users = User.objects.bulk_create([
+        User(username=f'{prefix}{index}', password=password)
+        for index in range(users)
+    ])
+    tokens = Token.objects.bulk_create([
+        Token(user=user, key=Token.generate_key()) for user in created_users
+    ])
+    created_habits = Habit.objects.bulk_create([
+        Habit(
+            user=user,
+            name=f'Habit {index}',
+            description='Generated by benchmarks.seed',
+            target=rng.randint(1, 60),
+            unit=rng.choice(UNITS),
+        )
+        for user in created_users
+        for index in range(habits)
+    ], batch_size=BATCH_SIZE)
+
+    records = 0
+    for batch in batches(generate_records(rng, created_habits, days, fill_rate)):
+        DailyRecord.objects.bulk_create(batch)
+        records += len(batch)
+
+    call_command('recompute_success', stdout=StringIO())
+    call_command('habit_stats', stdout=StringIO())
+    return {
+        'users': [user.username for user in created_users],
+        'tokens': [token.key for token in tokens],
+        'habits': len(created_habits),
+        'records': records,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--habits', type=int, default=10, help='habits per user')
+    parser.add_argument('--days', type=int, default=365, help='days of history per habit')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fill-rate', type=float, default=0.8, help='share of days with a record')
+    args = parser.parse_args()
+
+    result = seed(args.users, args.habits, args.days, args.seed, args.fill_rate)
+    print(f'{len(result["users"])} users, {result["habits"]} habits, {result["records"]} records '
+          f'(password {PASSWORD!r})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""Settings for benchmarks.load.
+
+BENCH_DATABASE=sqlite (default) runs against a throwaway SQLite file,
+BENCH_DATABASE=postgres against the POSTGRES_* database from
+config.settings. Caches go to a private temporary directory.
+"""
+import os
+import tempfile
+
+from config.settings import *  # noqa: F401,F403
+
+BENCH_DIR = tempfile.mkdtemp(prefix='habit-bench-')
+
+if os.environ.get('BENCH_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BENCH_DIR, 'db.sqlite3'),
+            'TEST': {'NAME': os.path.join(BENCH_DIR, 'test.sqlite3')},
+        }
+    }
+
+for alias, location in (('default', 'cache'), ('tokens', 'token_cache')):
+    CACHES[alias]['LOCATION'] = os.path.join(BENCH_DIR, location)
+
+ALLOWED_HOSTS = ['testserver']
+
+# Every login spends ~0.5 s hashing the password; logging each one with its
+# SQL would flood the output and run inside the timed requests.
+HABIT_SLOW_REQUEST_MS = float('inf')
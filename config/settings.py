@@ -7,7 +7,8 @@ SECRET_KEY = 'django-insecure-5yr%#xt5h^qw0_mh3e8)a4tabx5l8w!h2y%=#w%1uqh%pk^k=j
 
 DEBUG = False
 
-ALLOWED_HOSTS = ['0.0.0.0','localhost','127.0.0.1']
+# 'server' is the compose service name, used by scrapers inside its network.
+ALLOWED_HOSTS = ['0.0.0.0','localhost','127.0.0.1','server']
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -24,17 +25,33 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'habit.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'habit.renderers.ORJSONRenderer',
+        'habit.renderers.MessagePackRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'habit.renderers.ORJSONParser',
+        'habit.renderers.MessagePackParser',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'habit.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('HABIT_PAGE_SIZE', 100)),
 }
 
+HABIT_MAX_PAGE_SIZE = int(os.environ.get('HABIT_MAX_PAGE_SIZE', 500))
+
+HABIT_RECORDS_WINDOW_DAYS = int(os.environ.get('HABIT_RECORDS_WINDOW_DAYS', 30))
+HABIT_RECORDS_LIMIT = int(os.environ.get('HABIT_RECORDS_LIMIT', 30))
+HABIT_MAX_RECORDS_LIMIT = int(os.environ.get('HABIT_MAX_RECORDS_LIMIT', 366))
+
+HABIT_BULK_MAX_RECORDS = int(os.environ.get('HABIT_BULK_MAX_RECORDS', 10000))
+# Upper bound on the buckets one habits/series/ response may zero-fill.
+HABIT_SERIES_MAX_BUCKETS = int(os.environ.get('HABIT_SERIES_MAX_BUCKETS', 1000))
+
 MIDDLEWARE = [
+    'habit.middleware.RequestMetricsMiddleware',
+    'habit.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +80,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# SERVER_MODE=asgi runs gunicorn with uvicorn workers (see compose.yaml) and
+# serves habit/record reads through async views.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+HABIT_ASYNC_READS = SERVER_MODE == 'asgi'
+
 if DEBUG:
     DATABASES = {
     'default': {
@@ -77,11 +99,126 @@ else:
             'NAME': os.environ.get('POSTGRES_DB'),
             'USER': os.environ.get('POSTGRES_USER'),
             'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
-            'HOST':'db',
-            'PORT':5432,
-            
+            'HOST':os.environ.get('POSTGRES_HOST', 'db'),
+            'PORT':int(os.environ.get('POSTGRES_PORT', 5432)),
+            # Keep a worker's connection open between requests and ping it
+            # before reuse instead of reconnecting for every request. Under
+            # ASGI every request runs sync code in its own thread, so
+            # persistent connections would pile up: use POSTGRES_POOL there.
+            'CONN_MAX_AGE':int(os.environ.get('POSTGRES_CONN_MAX_AGE', 0 if SERVER_MODE == 'asgi' else 600)),
+            'CONN_HEALTH_CHECKS':True,
         }
     }
+    if os.environ.get('POSTGRES_POOL', '').lower() in ('1', 'true', 'yes'):
+        # psycopg 3 pool per worker process. Django requires CONN_MAX_AGE = 0
+        # with pooling (connections go back to the pool after each request)
+        # and turns CONN_HEALTH_CHECKS into the pool's connection check.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+                'timeout': float(os.environ.get('POSTGRES_POOL_TIMEOUT', 10)),
+                'max_idle': float(os.environ.get('POSTGRES_POOL_MAX_IDLE', 600)),
+                'max_lifetime': float(os.environ.get('POSTGRES_POOL_MAX_LIFETIME', 3600)),
+            },
+        }
+
+# POSTGRES_REPLICA_HOSTS=host[:port],... adds streaming replicas of the
+# primary (same database, user and password) as replica1, replica2, ...
+# Safe requests read from one of them; writes, reads inside transactions
+# (signal receivers, services) and users who wrote in the last
+# HABIT_REPLICA_PIN_SECONDS use the primary (habit/replicas.py). In tests
+# the replicas mirror the test database.
+# With DEBUG, SQLITE_REPLICAS=N adds replica1..N as separate SQLite files
+# that only catch up when `manage.py refresh_replicas` copies the primary
+# into them, so the routing and replica lag can be tried locally.
+HABIT_READ_REPLICAS = []
+if DEBUG:
+    for index in range(1, int(os.environ.get('SQLITE_REPLICAS', 0)) + 1):
+        alias = f'replica{index}'
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'db.{alias}.sqlite3',
+        }
+        HABIT_READ_REPLICAS.append(alias)
+else:
+    for index, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+        alias = f'replica{index}'
+        host, _, port = host.strip().partition(':')
+        DATABASES[alias] = {
+            **DATABASES['default'],
+            'HOST': host,
+            'PORT': int(port or DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+        HABIT_READ_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['habit.replicas.ReplicaRouter']
+
+# DailyRecord's covering index uses INCLUDE, which only Postgres supports;
+# SQLite builds it without the included column, as intended.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+HABIT_REPLICA_PIN_SECONDS = float(os.environ.get('HABIT_REPLICA_PIN_SECONDS', 5))
+# Longest replica lag to allow for: reads from a replica get no ETag and do
+# not fill the analytics cache until the version marker is this old.
+HABIT_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('HABIT_REPLICA_MAX_LAG_SECONDS', 30))
+
+# Shared by all gunicorn workers of a container; point CACHE_BACKEND at
+# another backend (e.g. Redis) when running several containers.
+# The default cache holds a version marker per user and per habit (stored
+# without expiry) plus analytics entries of up to a day of versions. A culled
+# marker is replaced by a fresh one, which is safe but throws away every
+# ETag and cached entry behind it, so MAX_ENTRIES must cover users + habits
+# with room to spare (the backend's default is only 300). FileBasedCache
+# lists its directory on every set; past a few hundred thousand entries use
+# Redis or Memcached instead.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', '/tmp/habit_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 200000)),
+        },
+    },
+    # token -> user for CachedTokenAuthentication. TIMEOUT bounds how long an
+    # entry can outlive a logout when the backend is per-process (LocMemCache).
+    'tokens': {
+        'BACKEND': os.environ.get('TOKEN_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('TOKEN_CACHE_LOCATION', '/tmp/habit_token_cache'),
+        'TIMEOUT': int(os.environ.get('TOKEN_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+# HABIT_RECORDS_PARTITIONING=month|year makes migration 0006 partition
+# habit_dailyrecord by date on Postgres (see habit/partitions.py); run
+# `manage.py habit_partitions` regularly to create upcoming partitions.
+HABIT_RECORDS_PARTITIONING = os.environ.get('HABIT_RECORDS_PARTITIONING', '')
+HABIT_RECORDS_PARTITIONS_AHEAD = int(os.environ.get('HABIT_RECORDS_PARTITIONS_AHEAD', 3))
+
+# `manage.py compact_records` folds daily records older than this many days
+# into weekly or monthly rollups (habit/rollups.py); statistics, success and
+# analytics read rollups plus the remaining raw records.
+HABIT_ROLLUP_HORIZON_DAYS = int(os.environ.get('HABIT_ROLLUP_HORIZON_DAYS', 365))
+HABIT_ROLLUP_PERIOD = os.environ.get('HABIT_ROLLUP_PERIOD', 'month')
+
+# Requests slower than this are logged with their SQL (logger habit.slow_requests).
+# Prometheus metrics are served at /metrics; with several gunicorn workers set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory shared by them.
+HABIT_SLOW_REQUEST_MS = int(os.environ.get('HABIT_SLOW_REQUEST_MS', 500))
+
+# /metrics answers requests from these addresses, or carrying
+# `Authorization: Bearer <HABIT_METRICS_TOKEN>` when the token is set.
+HABIT_METRICS_TOKEN = os.environ.get('HABIT_METRICS_TOKEN', '')
+HABIT_METRICS_ALLOWED_IPS = [
+    address.strip()
+    for address in os.environ.get('HABIT_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+    if address.strip()
+]
+
+HABIT_ANALYTICS_CACHE_TIMEOUT = int(os.environ.get('HABIT_ANALYTICS_CACHE_TIMEOUT', 60 * 60 * 24))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.urls import path,re_path,include
+from habit.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     re_path(r'^auth/', include('djoser.urls')),
     re_path(r'^auth/', include('djoser.urls.authtoken')),
     path('',include('habit.urls')),
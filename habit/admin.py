@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Habit, DailyRecord
+from .models import Habit, DailyRecord, DailyRecordRollup, DueHabit, HabitStats
 
 @admin.register(Habit)
 class HabitAdmin(admin.ModelAdmin):
@@ -10,6 +10,7 @@ class HabitAdmin(admin.ModelAdmin):
         'unit',
     ]
     list_filter = ['user']
+    list_select_related = ['user']
 
 @admin.register(DailyRecord)
 class DailyRecordAdmin(admin.ModelAdmin):
@@ -19,3 +20,45 @@ class DailyRecordAdmin(admin.ModelAdmin):
         'amount_achieved',
     ]
     list_filter = ['date','habit']
+    list_select_related = ['habit__user']
+
+
+@admin.register(HabitStats)
+class HabitStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        'habit',
+        'count',
+        'total',
+        'best',
+        'success',
+        'current_streak',
+        'longest_streak',
+    ]
+    list_select_related = ['habit__user']
+
+
+@admin.register(DailyRecordRollup)
+class DailyRecordRollupAdmin(admin.ModelAdmin):
+    list_display = [
+        'habit',
+        'period_start',
+        'period_end',
+        'count',
+        'total',
+        'hits',
+    ]
+    list_filter = ['period_start']
+    list_select_related = ['habit__user']
+
+
+@admin.register(DueHabit)
+class DueHabitAdmin(admin.ModelAdmin):
+    list_display = [
+        'habit',
+        'user',
+        'date',
+        'target',
+        'amount_achieved',
+    ]
+    list_filter = ['date']
+    list_select_related = ['habit__user', 'user']
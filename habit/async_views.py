@@ -0,0 +1,94 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class AsyncReadMixin:
+    # Async twins of list() and retrieve(), served by async_read_view() when
+    # the app runs under ASGI. They reuse the viewset's queryset, pagination,
+    # serializer and permission hooks; only the database access is awaited.
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            instance = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, ValueError, TypeError):
+            raise Http404
+        # IsOwner compares ids already on the row, so no query runs here.
+        self.check_object_permissions(request, instance)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    async def aauthenticate(self, request):
+        for authenticator in request.authenticators:
+            aauthenticate = getattr(authenticator, 'aauthenticate', None)
+            if aauthenticate is not None:
+                result = await aauthenticate(request)
+            else:
+                result = await sync_to_async(authenticator.authenticate)(request)
+            if result is not None:
+                request.user, request.auth = result
+                return
+        request.user, request.auth = AnonymousUser(), None
+
+    async def ainitial(self, request, *args, **kwargs):
+        # initial() step for step, with the authentication awaited. Mixins
+        # hooking into initial() provide an ainitial() as well.
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+        await self.aauthenticate(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            handler = getattr(self, f'a{self.action}')
+            if hasattr(self, 'aconditional_response'):
+                response = await self.aconditional_response(handler, request, *args, **kwargs)
+            else:
+                response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_read_view(viewset, actions, detail):
+    # GET/HEAD run natively async; writes fall through to the regular
+    # synchronous DRF view in a worker thread. detail is what the router
+    # would pass for the same route.
+    sync_view = viewset.as_view(actions, detail=detail)
+    read_action = actions['get']
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        self = viewset(action_map={'get': read_action, 'head': read_action}, detail=detail)
+        return await self.adispatch(request, *args, **kwargs)
+
+    return view
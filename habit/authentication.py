@@ -0,0 +1,96 @@
+import hashlib
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import new_version
+
+TOKEN_CACHE_ALIAS = 'tokens'
+
+
+def token_cache_keys(key):
+    # The entry and the token's version marker, read together.
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'habit:token:{digest}', f'habit:token-version:{digest}'
+
+
+def forget_tokens(keys):
+    # A new version orphans the entries, including one written by a request
+    # that read the token just before it was deleted. Bumped again after
+    # commit, as in habit/cache.py, since that read may see the old row until then.
+    def forget():
+        caches[TOKEN_CACHE_ALIAS].set_many({token_cache_keys(key)[1]: new_version() for key in keys}, None)
+
+    forget()
+    transaction.on_commit(forget)
+
+
+class TokenKeyReader(TokenAuthentication):
+    # DRF's own header parsing and validation, returning the key instead of
+    # looking it up.
+
+    def authenticate_credentials(self, key):
+        return key, None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # TokenAuthentication that remembers token -> (user id, is_active) in the
+    # 'tokens' cache. Entries are invalidated on logout (token deletion) and
+    # whenever the user is saved or deleted; see habit/signals.py.
+
+    async def aauthenticate(self, request):
+        reader = TokenKeyReader()
+        reader.keyword = self.keyword
+        parsed = reader.authenticate(request)
+        if parsed is None:
+            return None
+        return await self.aauthenticate_credentials(parsed[0])
+
+    def authenticate_credentials(self, key):
+        token_cache = caches[TOKEN_CACHE_ALIAS]
+        entry_key, version_key = token_cache_keys(key)
+        cached = token_cache.get_many([entry_key, version_key])
+        version = cached.get(version_key)
+        if version is not None and cached.get(entry_key, (None,))[0] == version:
+            return self.cached_credentials(key, *cached[entry_key][1:])
+        if version is None:
+            token_cache.add(version_key, new_version(), None)
+            version = token_cache.get(version_key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(entry_key, (version, user.pk, user.is_active))
+        return user, token
+
+    async def aauthenticate_credentials(self, key):
+        token_cache = caches[TOKEN_CACHE_ALIAS]
+        entry_key, version_key = token_cache_keys(key)
+        cached = await token_cache.aget_many([entry_key, version_key])
+        version = cached.get(version_key)
+        if version is not None and cached.get(entry_key, (None,))[0] == version:
+            return self.cached_credentials(key, *cached[entry_key][1:])
+        if version is None:
+            await token_cache.aadd(version_key, new_version(), None)
+            version = await token_cache.aget(version_key)
+        model = self.get_model()
+        try:
+            token = await model.objects.select_related('user').aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        await token_cache.aset(entry_key, (version, token.user.pk, token.user.is_active))
+        return token.user, token
+
+    def cached_credentials(self, key, user_id, is_active):
+        # Only the id and is_active are cached; every other field of the
+        # user (and the token) is deferred and loaded by pk on first access.
+        if not is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        model = self.get_model()
+        user_model = model._meta.get_field('user').related_model
+        user = user_model.from_db(None, [user_model._meta.pk.attname, 'is_active'], [user_id, is_active])
+        token = model.from_db(None, ['key', 'user_id'], [key, user_id])
+        token.user = user
+        return user, token
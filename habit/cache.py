@@ -0,0 +1,38 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(scope, pk):
+    return f'habit:version:{scope}:{pk}'
+
+
+def new_version():
+    return f'{time.time():.6f}-{uuid.uuid4().hex}'
+
+
+def version_timestamp(version):
+    return float(version.split('-', 1)[0])
+
+
+def get_version(scope, pk):
+    key = version_key(scope, pk)
+    version = cache.get(key)
+    if version is None:
+        # A fresh random marker, so a cold or culled cache can never hand
+        # out a version that was already used for older data.
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(scope, pks):
+    def bump():
+        cache.set_many({version_key(scope, pk): new_version() for pk in pks}, None)
+
+    # Bump now so this process stops serving old entries at once, and again
+    # after commit so nothing cached from pre-commit data survives.
+    bump()
+    transaction.on_commit(bump)
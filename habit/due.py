@@ -0,0 +1,67 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections, router, transaction
+from django.db.models import DateField, F, FilteredRelation, Max, Min, Q, Value
+
+from .models import Habit, DueHabit
+
+DUE_CHUNK_SIZE = 10000
+DUE_COLUMNS = ['date', 'user_id', 'habit_id', 'target', 'amount_achieved']
+
+
+def due_habits(day):
+    # Habits without an on-target record for `day`: a LEFT JOIN on that
+    # day's record (at most one per habit) keeping the rows where it is
+    # missing or below target.
+    return (
+        Habit.objects.annotate(today=FilteredRelation('daily_records', condition=Q(daily_records__date=day)))
+        .filter(Q(today__isnull=True) | Q(today__amount_achieved__lt=F('target')))
+        .order_by()
+    )
+
+
+def write_due(day, start, end):
+    # Replaces the stored rows of users start <= id < end with one
+    # INSERT ... SELECT; nothing passes through Python.
+    rows = due_habits(day).filter(user_id__gte=start, user_id__lt=end).values_list(
+        Value(day, output_field=DateField()),
+        'user_id',
+        'id',
+        'target',
+        'today__amount_achieved',
+    )
+    sql, params = rows.query.sql_with_params()
+    using = router.db_for_write(DueHabit)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        DueHabit.objects.using(using).filter(date=day, user_id__gte=start, user_id__lt=end).delete()
+        cursor.execute(
+            f'INSERT INTO {DueHabit._meta.db_table} ({", ".join(DUE_COLUMNS)}) {sql}',
+            params,
+        )
+        return cursor.rowcount
+
+
+def user_id_chunks(chunk_size):
+    bounds = Habit.objects.aggregate(low=Min('user_id'), high=Max('user_id'))
+    if bounds['low'] is None:
+        return []
+    return [(start, start + chunk_size) for start in range(bounds['low'], bounds['high'] + 1, chunk_size)]
+
+
+def compute_due(day, chunk_size=DUE_CHUNK_SIZE, workers=1):
+    # Yields (start, end, rows) per chunk of user ids. With workers > 1 the
+    # chunks run in forked processes, each on its own database connection.
+    chunks = user_id_chunks(chunk_size)
+    if workers <= 1:
+        for start, end in chunks:
+            yield start, end, write_due(day, start, end)
+        return
+
+    # Children must not share the parent's sockets.
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [(start, end, pool.submit(write_due, day, start, end)) for start, end in chunks]
+        for start, end, future in futures:
+            yield start, end, future.result()
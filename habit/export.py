@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Habit
+
+EXPORT_CHUNK_SIZE = 2000
+
+HABIT_COLUMNS = ['id', 'name', 'description', 'target', 'unit', 'success']
+RECORD_COLUMNS = ['daily_records__id', 'daily_records__date', 'daily_records__amount_achieved']
+
+CSV_HEADER = [
+    'habit_id',
+    'habit_name',
+    'habit_description',
+    'target',
+    'unit',
+    'success',
+    'record_id',
+    'date',
+    'amount_achieved',
+]
+
+
+def export_rows(user, using=None):
+    # One LEFT JOIN ordered by (habit, date), read through a server-side
+    # cursor: a habit is followed by its records, and habits without records
+    # still show up once.
+    return (
+        Habit.objects.using(using).filter(user=user)
+        .order_by('id', 'daily_records__date')
+        .values_list(*HABIT_COLUMNS, *RECORD_COLUMNS)
+    )
+
+
+class CSVEncoder:
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self):
+        self.writer.writerow(CSV_HEADER)
+        return self.flush()
+
+    def encode(self, row):
+        self.writer.writerow(row)
+
+    def flush(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class NDJSONEncoder:
+    content_type = 'application/x-ndjson; charset=utf-8'
+    extension = 'ndjson'
+
+    def __init__(self):
+        self.lines = []
+        self.habit_id = None
+
+    def header(self):
+        return ''
+
+    def encode(self, row):
+        habit, record = row[:len(HABIT_COLUMNS)], row[len(HABIT_COLUMNS):]
+        if habit[0] != self.habit_id:
+            self.habit_id = habit[0]
+            self.write({'type': 'habit', **dict(zip(HABIT_COLUMNS, habit))})
+        if record[0] is not None:
+            record_id, day, amount = record
+            self.write({
+                'type': 'record',
+                'id': record_id,
+                'habit': habit[0],
+                'date': day.isoformat(),
+                'amount_achieved': amount,
+            })
+
+    def write(self, item):
+        self.lines.append(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+        self.lines.append('\n')
+
+    def flush(self):
+        data = ''.join(self.lines)
+        self.lines.clear()
+        return data
+
+
+ENCODERS = {
+    'csv': CSVEncoder,
+    'ndjson': NDJSONEncoder,
+}
+
+
+def stream_export(user, encoder, using=None):
+    yield encoder.header()
+    rows = export_rows(user, using).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+        yield encode_chunk(encoder, chunk)
+
+
+async def astream_export(user, encoder, using=None):
+    # The cursor is opened and read in the thread that owns the connection;
+    # QuerySet.aiterator() would run values_list() queries on the event loop.
+    rows = None
+
+    def next_chunk():
+        nonlocal rows
+        if rows is None:
+            rows = export_rows(user, using).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return list(islice(rows, EXPORT_CHUNK_SIZE))
+
+    yield encoder.header()
+    while chunk := await sync_to_async(next_chunk)():
+        yield encode_chunk(encoder, chunk)
+
+
+def encode_chunk(encoder, chunk):
+    for row in chunk:
+        encoder.encode(row)
+    return encoder.flush()
@@ -0,0 +1,175 @@
+import csv
+import json
+from datetime import date
+from itertools import islice
+
+from django.db import connections, router, transaction
+
+from .models import Habit, DailyRecord, DailyRecordRollup
+from .rollups import CompactedHistory, reject_compacted
+from .services import latest_records, records_changed, write_records
+
+IMPORT_BATCH_SIZE = 5000
+
+
+class ImportFailed(ValueError):
+    pass
+
+
+class ForeignHabits(ImportFailed):
+    pass
+
+
+def parse_row(line_no, habit, day, amount):
+    try:
+        row = int(habit), date.fromisoformat(str(day)), int(amount)
+    except (TypeError, ValueError):
+        raise ImportFailed(f'Line {line_no}: expected integer habit, ISO date and integer amount_achieved.')
+    if row[2] < 0:
+        raise ImportFailed(f'Line {line_no}: amount_achieved must not be negative.')
+    return row
+
+
+def parse_csv(lines):
+    # Accepts the habits/export/ layout (habit_id, ..., date, amount_achieved)
+    # as well as a plain habit,date,amount_achieved file.
+    reader = csv.DictReader(lines)
+    habit_column = 'habit_id' if 'habit_id' in (reader.fieldnames or ()) else 'habit'
+    for row in reader:
+        if not row.get('date') and not row.get('amount_achieved'):
+            continue  # an exported habit without records
+        yield parse_row(reader.line_num, row.get(habit_column), row.get('date'), row.get('amount_achieved'))
+
+
+def parse_ndjson(lines):
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise ImportFailed(f'Line {line_no}: invalid JSON.')
+        if not isinstance(item, dict):
+            raise ImportFailed(f'Line {line_no}: expected a JSON object.')
+        if item.get('type', 'record') != 'record':
+            continue
+        yield parse_row(line_no, item.get('habit'), item.get('date'), item.get('amount_achieved'))
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ndjson': parse_ndjson,
+}
+
+
+def import_records(rows, user=None):
+    # Loads (habit_id, date, amount_achieved) rows and merges them into the
+    # daily records; a later row for the same (habit, date) wins. With a user
+    # every habit must belong to them. Success, stats and cache versions are
+    # refreshed once for all affected habits at the end.
+    using = router.db_for_write(DailyRecord)
+    connection = connections[using]
+    try:
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                count, habit_ids, user_ids = copy_import(connection, rows, user)
+            else:
+                count, habit_ids, user_ids = batched_import(rows, user)
+            records_changed(habit_ids, user_ids)
+    except UnicodeDecodeError:
+        raise ImportFailed('The file is not valid UTF-8.')
+    return {'records': count, 'habits': len(habit_ids)}
+
+
+def copy_import(connection, rows, user):
+    # Load into a temporary staging table (COPY on Postgres, batched INSERTs
+    # elsewhere), then one set-based merge into habit_dailyrecord honouring
+    # unique_daily_record. seq keeps the file order for "later row wins".
+    records = connection.ops.quote_name(DailyRecord._meta.db_table)
+    habits = connection.ops.quote_name(Habit._meta.db_table)
+    rollups = connection.ops.quote_name(DailyRecordRollup._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE habit_import ('
+            'seq bigint NOT NULL, habit_id bigint NOT NULL, date date NOT NULL, amount_achieved integer NOT NULL'
+            ')'
+        )
+        stage_rows(connection, cursor, rows)
+        cursor.execute('ANALYZE habit_import')
+
+        cursor.execute(
+            f'SELECT i.habit_id FROM habit_import i LEFT JOIN {habits} h ON h.id = i.habit_id '
+            'WHERE h.id IS NULL OR (CAST(%s AS bigint) IS NOT NULL AND h.user_id <> CAST(%s AS bigint)) LIMIT 1',
+            [getattr(user, 'pk', None)] * 2,
+        )
+        foreign = cursor.fetchone()
+        if foreign is not None:
+            raise ForeignHabits(f'Habit {foreign[0]} does not exist or belongs to another user.')
+
+        cursor.execute(
+            f'SELECT i.habit_id, r.period_end FROM habit_import i JOIN {rollups} r '
+            'ON r.habit_id = i.habit_id AND r.period_end >= i.date LIMIT 1'
+        )
+        compacted = cursor.fetchone()
+        if compacted is not None:
+            habit_id, horizon = compacted
+            raise ImportFailed(str(CompactedHistory(habit_id, date.fromisoformat(str(horizon)))))
+
+        cursor.execute(
+            f'INSERT INTO {records} (habit_id, date, amount_achieved) '
+            'SELECT habit_id, date, amount_achieved FROM ('
+            'SELECT habit_id, date, amount_achieved, '
+            'ROW_NUMBER() OVER (PARTITION BY habit_id, date ORDER BY seq DESC) AS position '
+            'FROM habit_import'
+            ') latest WHERE position = 1 '
+            'ON CONFLICT (habit_id, date) DO UPDATE SET amount_achieved = EXCLUDED.amount_achieved'
+        )
+        count = cursor.rowcount
+
+        cursor.execute('SELECT DISTINCT habit_id FROM habit_import ORDER BY habit_id')
+        habit_ids = [habit_id for habit_id, in cursor.fetchall()]
+        cursor.execute(f'SELECT DISTINCT user_id FROM {habits} WHERE id IN (SELECT habit_id FROM habit_import)')
+        user_ids = [user_id for user_id, in cursor.fetchall()]
+        # Dropped here rather than ON COMMIT: the import may run inside an
+        # outer transaction. On errors the rollback removes it.
+        cursor.execute('DROP TABLE habit_import')
+    return count, habit_ids, user_ids
+
+
+def stage_rows(connection, cursor, rows):
+    rows = ((seq, habit_id, day, amount) for seq, (habit_id, day, amount) in enumerate(rows))
+    if connection.vendor == 'postgresql':
+        with cursor.copy('COPY habit_import (seq, habit_id, date, amount_achieved) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(row)
+        return
+    while batch := list(islice(rows, IMPORT_BATCH_SIZE)):
+        cursor.executemany(
+            'INSERT INTO habit_import (seq, habit_id, date, amount_achieved) VALUES (%s, %s, %s, %s)',
+            [(seq, habit_id, connection.ops.adapt_datefield_value(day), amount) for seq, habit_id, day, amount in batch],
+        )
+
+
+def batched_import(rows, user):
+    # Portable fallback (SQLite in development): bulk upserts in batches.
+    owners = {}
+    count = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, IMPORT_BATCH_SIZE)):
+        latest = latest_records(batch)
+        unknown = {habit_id for habit_id, _ in latest} - owners.keys()
+        if unknown:
+            habits = Habit.objects.filter(id__in=unknown)
+            if user is not None:
+                habits = habits.filter(user=user)
+            owners.update(habits.values_list('id', 'user_id'))
+            missing = unknown - owners.keys()
+            if missing:
+                raise ForeignHabits(f'Habit {min(missing)} does not exist or belongs to another user.')
+        try:
+            reject_compacted(latest)
+        except CompactedHistory as exc:
+            raise ImportFailed(str(exc))
+        write_records(latest)
+        count += len(latest)
+    return count, sorted(owners), sorted(set(owners.values()))
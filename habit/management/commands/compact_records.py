@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from habit.rollups import COMPACT_BATCH_SIZE, PERIODS, compact_records
+
+# Analytics and the records window on habits/ read the last 30 days raw.
+MIN_HORIZON_DAYS = 31
+
+
+class Command(BaseCommand):
+    help = 'Fold daily records older than the horizon into weekly or monthly rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon',
+            type=int,
+            default=settings.HABIT_ROLLUP_HORIZON_DAYS,
+            help='Keep records of the last N days as they are.',
+        )
+        parser.add_argument('--period', choices=PERIODS, default=settings.HABIT_ROLLUP_PERIOD)
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['horizon'] < MIN_HORIZON_DAYS:
+            raise CommandError(f'--horizon must be at least {MIN_HORIZON_DAYS} days.')
+        before = timezone.localdate() - timedelta(days=options['horizon'])
+        records = rollups = 0
+        for habit_ids, deleted, written in compact_records(before, options['period'], options['batch_size']):
+            records += deleted
+            rollups += written
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Habits {habit_ids[0]}-{habit_ids[-1]}: {deleted} records')
+        self.stdout.write(self.style.SUCCESS(f'Compacted {records} records into {rollups} rollups.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from habit.due import DUE_CHUNK_SIZE, compute_due
+
+
+class Command(BaseCommand):
+    help = 'Store the habits without an on-target record for a day, one anti-join per chunk of user ids.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='YYYY-MM-DD, today by default.')
+        parser.add_argument('--chunk-size', type=int, default=DUE_CHUNK_SIZE, help='User ids per chunk.')
+        parser.add_argument('--workers', type=int, default=1, help='Processes writing chunks in parallel.')
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options['date']:
+            try:
+                day = parse_date(options['date'])
+            except ValueError:
+                day = None
+            if day is None:
+                raise CommandError('--date must be a valid YYYY-MM-DD date.')
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive.')
+        total = 0
+        for start, end, written in compute_due(day, options['chunk_size'], options['workers']):
+            total += written
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Users {start}-{end - 1}: {written} rows')
+        self.stdout.write(self.style.SUCCESS(f'Stored {total} due habits for {day}.'))
@@ -0,0 +1,65 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from habit import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Create upcoming habit_dailyrecord partitions (Postgres, partitioned layout), '
+        'convert the table, or detach/drop old partitions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, help='Periods to create after the current one.')
+        parser.add_argument(
+            '--convert',
+            choices=partitions.INTERVALS,
+            help='Partition an existing plain table by month or year.',
+        )
+        parser.add_argument(
+            '--detach-before',
+            type=date.fromisoformat,
+            help='Detach partitions ending on or before this date, keeping them as <name>_detached.',
+        )
+        parser.add_argument(
+            '--drop-before',
+            type=date.fromisoformat,
+            help='Drop partitions ending on or before this date.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            if options['convert'] or options['detach_before'] or options['drop_before']:
+                raise CommandError('Partitioning needs PostgreSQL.')
+            self.stdout.write('Not PostgreSQL: daily records are not partitioned.')
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['convert']:
+                if partitions.is_partitioned(cursor):
+                    raise CommandError(f'{partitions.TABLE} is already partitioned.')
+                partitions.convert(cursor, options['convert'], ahead=options['ahead'])
+                self.stdout.write(f'Partitioned {partitions.TABLE} by {options["convert"]}.')
+            elif not partitions.is_partitioned(cursor):
+                if options['detach_before'] or options['drop_before']:
+                    raise CommandError(f'{partitions.TABLE} is not partitioned.')
+                if settings.HABIT_RECORDS_PARTITIONING:
+                    self.stderr.write(
+                        f'HABIT_RECORDS_PARTITIONING is set but {partitions.TABLE} is not partitioned; '
+                        f'run with --convert {settings.HABIT_RECORDS_PARTITIONING}.'
+                    )
+                return
+
+            for name in partitions.ensure_partitions(cursor, ahead=options['ahead']):
+                self.stdout.write(f'Created {name}')
+            before, drop = options['drop_before'] or options['detach_before'], bool(options['drop_before'])
+            if before is not None:
+                for name in partitions.remove_partitions(cursor, before, drop=drop):
+                    self.stdout.write(f'{"Dropped" if drop else "Detached"} {name}')
+
+            names = [name for name, _, _ in partitions.list_partitions(cursor)]
+            self.stdout.write(self.style.SUCCESS(f'{len(names)} partitions: {", ".join(names)}'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from habit.models import HabitStats
+from habit.stats import STATS_FIELDS, compute_stats, iter_habit_ids, rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the per-habit statistics from the raw daily records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Compare stored statistics with the raw records without writing anything.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify(options['batch_size'])
+        else:
+            self.rebuild(options['batch_size'])
+
+    def rebuild(self, batch_size):
+        rebuilt = 0
+        for habit_ids in iter_habit_ids(batch_size):
+            with transaction.atomic():
+                rebuild_stats(habit_ids)
+            rebuilt += len(habit_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {rebuilt} habits.'))
+
+    def verify(self, batch_size):
+        checked = mismatched = 0
+        for habit_ids in iter_habit_ids(batch_size):
+            expected = compute_stats(habit_ids)
+            stored = HabitStats.objects.in_bulk(habit_ids)
+            for habit_id, fresh in expected.items():
+                current = stored.get(habit_id)
+                diff = [
+                    field for field in STATS_FIELDS
+                    if current is None or getattr(current, field) != getattr(fresh, field)
+                ]
+                if diff:
+                    mismatched += 1
+                    self.stderr.write(f'Habit {habit_id}: {", ".join(diff)} out of date')
+            checked += len(habit_ids)
+        if mismatched:
+            raise CommandError(f'{mismatched} of {checked} habits have stale statistics.')
+        self.stdout.write(self.style.SUCCESS(f'Statistics for {checked} habits are up to date.'))
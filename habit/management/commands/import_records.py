@@ -0,0 +1,42 @@
+import os
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from habit.importing import PARSERS, ImportFailed, import_records
+
+
+class Command(BaseCommand):
+    help = 'Import daily records from a CSV or NDJSON file (COPY into a staging table on Postgres).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument('--type', choices=sorted(PARSERS), help='Defaults to the file extension.')
+        parser.add_argument('--user', help='Only accept habits owned by this username.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_type = options['type'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if import_type not in PARSERS:
+            raise CommandError('Cannot tell the file type; pass --type.')
+
+        user = None
+        if options['user']:
+            User = get_user_model()
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist.')
+
+        lines = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            result = import_records(PARSERS[import_type](lines), user=user)
+        except ImportFailed as exc:
+            raise CommandError(str(exc))
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["records"]} records into {result["habits"]} habits.'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from habit.services import SUCCESS_BATCH_SIZE, recompute_success
+
+
+class Command(BaseCommand):
+    help = 'Recompute Habit.success for every habit with one set-based UPDATE per id range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SUCCESS_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = 0
+        for start, end, updated in recompute_success(options['batch_size']):
+            total += updated
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Habits {start}-{end}: {updated} rows')
+        self.stdout.write(self.style.SUCCESS(f'Recomputed success for {total} habits.'))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from habit.replicas import copy_primary
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the SQLITE_REPLICAS files.'
+
+    def handle(self, *args, **options):
+        for alias in settings.HABIT_READ_REPLICAS:
+            try:
+                copy_primary(alias)
+            except ValueError as exc:
+                raise CommandError(f'{exc} Streaming replicas catch up on their own.')
+            self.stdout.write(self.style.SUCCESS(f'Copied the primary into {alias}.'))
@@ -0,0 +1,123 @@
+import contextlib
+import contextvars
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+
+# With PROMETHEUS_MULTIPROC_DIR set, every gunicorn worker writes its samples
+# to files in that directory and /metrics merges them.
+REQUEST_DURATION = Histogram(
+    'habit_request_duration_seconds', 'Time spent handling a request.', ['view', 'method', 'status'],
+)
+DB_QUERIES = Histogram(
+    'habit_request_db_queries', 'SQL queries per request.', ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+)
+DB_DURATION = Histogram(
+    'habit_request_db_duration_seconds', 'Time spent in SQL per request.', ['view'],
+)
+SERIALIZE_DURATION = Histogram(
+    'habit_request_serialize_duration_seconds', 'Time spent turning objects into response data.', ['view'],
+)
+RENDER_DURATION = Histogram(
+    'habit_request_render_duration_seconds', 'Time spent rendering the response data into the body.', ['view'],
+)
+
+current_request = contextvars.ContextVar('habit_request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.db_time = 0.0
+        self.serialize_time = None
+        self.render_time = None
+
+    def observe(self, view, method, status, total):
+        REQUEST_DURATION.labels(view, method, status).observe(total)
+        DB_QUERIES.labels(view).observe(len(self.queries))
+        DB_DURATION.labels(view).observe(self.db_time)
+        if self.serialize_time is not None:
+            SERIALIZE_DURATION.labels(view).observe(self.serialize_time)
+        if self.render_time is not None:
+            RENDER_DURATION.labels(view).observe(self.render_time)
+
+    def server_timing(self, total):
+        timings = [f'db;dur={self.db_time * 1000:.1f};desc="{len(self.queries)} queries"']
+        if self.serialize_time is not None:
+            timings.append(f'serialize;dur={self.serialize_time * 1000:.1f}')
+        if self.render_time is not None:
+            timings.append(f'render;dur={self.render_time * 1000:.1f}')
+        timings.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(timings)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection once; counts only while a request is
+    # being measured. The context variable follows sync_to_async threads.
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.db_time += duration
+        metrics.queries.append((sql, duration))
+
+
+@contextlib.contextmanager
+def measure_serialization():
+    # Adds up to RequestMetrics.serialize_time; see MeasuredSerializerMixin.
+    metrics = current_request.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialize_time = (metrics.serialize_time or 0.0) + time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(request_started)
+def install_query_recorders(sender=None, **kwargs):
+    # Runs in the thread that serves the request's ORM calls (for ASGI the
+    # sync_to_async thread), which may hold connections opened earlier.
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection=connection)
+
+
+def scrape_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.HABIT_METRICS_ALLOWED_IPS:
+        return True
+    token = settings.HABIT_METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )
+
+
+def metrics_view(request):
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,121 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .metrics import RequestMetrics, current_request
+from .replicas import choose_replica, read_alias
+
+slow_request_logger = logging.getLogger('habit.slow_requests')
+
+SLOW_REQUEST_MAX_QUERIES = 100
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestMetricsMiddleware:
+    # Per-request latency, SQL count/time and render time: exported as
+    # Prometheus histograms (see habit/metrics.py), sent back in a
+    # Server-Timing header, and logged with the SQL when the request took
+    # longer than HABIT_SLOW_REQUEST_MS.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # Called last, right before DRF's renderer runs.
+        metrics = current_request.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time = time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        resolver_match = request.resolver_match
+        view = resolver_match.view_name if resolver_match is not None else 'unmatched'
+        metrics.observe(view, request.method, response.status_code, total)
+        response['Server-Timing'] = metrics.server_timing(total)
+        if total * 1000 >= settings.HABIT_SLOW_REQUEST_MS:
+            self.log_slow_request(request, view, total, metrics)
+        return response
+
+    def log_slow_request(self, request, view, total, metrics):
+        lines = [
+            f'  {duration * 1000:8.1f} ms  {sql}'
+            for sql, duration in metrics.queries[:SLOW_REQUEST_MAX_QUERIES]
+        ]
+        if len(metrics.queries) > SLOW_REQUEST_MAX_QUERIES:
+            lines.append(f'  ... {len(metrics.queries) - SLOW_REQUEST_MAX_QUERIES} more queries')
+        slow_request_logger.warning(
+            'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s',
+            request.method, request.get_full_path(), view, total * 1000,
+            len(metrics.queries), metrics.db_time * 1000, '\n'.join(lines),
+        )
+
+
+class ReplicaRoutingMiddleware:
+    # Picks the database the reads of a request go to (see habit/replicas.py):
+    # one replica for the whole of a safe request, so its queries never mix
+    # replicas with different lag, and the primary for requests that write.
+    # Views with ReadYourWritesMixin move users who wrote recently back to
+    # the primary.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = read_alias.set(self.read_alias_for(request))
+        try:
+            return self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+    async def __acall__(self, request):
+        token = read_alias.set(self.read_alias_for(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+    def read_alias_for(self, request):
+        if request.method in SAFE_METHODS:
+            return choose_replica()
+        return DEFAULT_DB_ALIAS
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:32
+
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def compute_streaks(hit_dates):
+    # Frozen copy of habit.stats.compute_streaks as of this migration, so
+    # later changes to the live code cannot alter the backfill.
+    current = longest = 0
+    previous = None
+    for day in hit_dates:
+        if previous is not None and day - previous == timedelta(days=1):
+            current += 1
+        else:
+            current = 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest, previous
+
+
+def backfill_stats(apps, schema_editor):
+    # Per range of habit ids: one GROUP BY for the aggregates and one pass
+    # over the on-target dates ordered by (habit_id, date) for the streaks.
+    Habit = apps.get_model('habit', 'Habit')
+    DailyRecord = apps.get_model('habit', 'DailyRecord')
+    HabitStats = apps.get_model('habit', 'HabitStats')
+
+    last_id = 0
+    while True:
+        ids = list(Habit.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BACKFILL_BATCH_SIZE])
+        if not ids:
+            return
+        records = DailyRecord.objects.filter(habit_id__gte=ids[0], habit_id__lte=ids[-1])
+        aggregates = {
+            row['habit_id']: row
+            for row in records.values('habit_id').annotate(
+                count=models.Count('id'),
+                total=models.Sum('amount_achieved'),
+                best=models.Max('amount_achieved'),
+            ).order_by()
+        }
+        hit_dates = (
+            records.filter(amount_achieved__gte=models.F('habit__target'))
+            .order_by('habit_id', 'date')
+            .values_list('habit_id', 'date')
+        )
+        streaks = {
+            habit_id: compute_streaks(day for _, day in rows)
+            for habit_id, rows in groupby(hit_dates.iterator(chunk_size=5000), key=itemgetter(0))
+        }
+
+        stats = []
+        for habit_id in ids:
+            row = aggregates.get(habit_id, {'count': 0, 'total': None, 'best': None})
+            current, longest, last_hit = streaks.get(habit_id, (0, 0, None))
+            stats.append(HabitStats(
+                habit_id=habit_id,
+                count=row['count'],
+                total=row['total'],
+                best=row['best'],
+                average=row['total'] / row['count'] if row['count'] else None,
+                success=last_hit is not None,
+                current_streak=current,
+                longest_streak=longest,
+                last_hit=last_hit,
+            ))
+        HabitStats.objects.bulk_create(stats)
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0002_habit_success'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStats',
+            fields=[
+                ('habit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='habit.habit')),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.BigIntegerField(null=True)),
+                ('best', models.IntegerField(null=True)),
+                ('average', models.FloatField(null=True)),
+                ('success', models.BooleanField(default=False)),
+                ('current_streak', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('last_hit', models.DateField(null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0003_habitstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['user', 'id'], name='habit_user_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='dailyrecord',
+            name='habit',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_records', to='habit.habit'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='habits', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.contrib.postgres import operations
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(operations.AddIndexConcurrently):
+    # Built CONCURRENTLY on Postgres so writes are not blocked; Django only
+    # supports that there, so other backends add the index the plain way.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('habit', '0004_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='dailyrecord',
+            index=models.Index(
+                fields=['habit', '-date'],
+                include=['amount_achieved'],
+                name='dailyrecord_habit_date_cover',
+            ),
+        ),
+    ]
@@ -0,0 +1,139 @@
+from datetime import date
+
+from django.conf import settings
+from django.db import migrations
+
+# Frozen copy of the conversion in habit/partitions.py as of this migration,
+# so later changes to the live module (and the models and services it
+# imports) cannot alter it.
+
+TABLE = 'habit_dailyrecord'
+HABITS = 'habit_habit'
+DEFAULT_PARTITION = f'{TABLE}_default'
+SEQUENCE = f'{TABLE}_id_seq'
+INTERVALS = ('month', 'year')
+
+
+def period_start(day, interval):
+    if interval == 'year':
+        return date(day.year, 1, 1)
+    return date(day.year, day.month, 1)
+
+
+def next_period(start, interval):
+    if interval == 'year':
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    if interval == 'year':
+        return f'{TABLE}_y{start.year}'
+    return f'{TABLE}_y{start.year}m{start.month:02d}'
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [TABLE])
+    return cursor.fetchone()[0] == 'p'
+
+
+def foreign_key_name(cursor):
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [TABLE],
+    )
+    return cursor.fetchone()[0]
+
+
+def add_constraints(cursor, primary_key, foreign_key):
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({", ".join(primary_key)})')
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT unique_daily_record UNIQUE (habit_id, date)')
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {foreign_key} FOREIGN KEY (habit_id) '
+        f'REFERENCES {HABITS} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(
+        f'CREATE INDEX dailyrecord_habit_date_cover ON {TABLE} (habit_id, date DESC) INCLUDE (amount_achieved)'
+    )
+
+
+def convert(cursor, interval, ahead):
+    if interval not in INTERVALS:
+        raise ValueError(f'interval must be one of {INTERVALS}')
+    today = date.today()
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    foreign_key = foreign_key_name(cursor)
+    cursor.execute(f'SELECT min(date), COALESCE(max(id), 0) FROM {TABLE}')
+    first_day, max_id = cursor.fetchone()
+
+    staging = f'{TABLE}_partitioned'
+    cursor.execute(f'CREATE TABLE {staging} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (date)')
+    cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging} DEFAULT')
+    start = period_start(min(first_day or today, today), interval)
+    last = period_start(today, interval)
+    for _ in range(ahead):
+        last = next_period(last, interval)
+    while start <= last:
+        end = next_period(start, interval)
+        cursor.execute(
+            f"CREATE TABLE {partition_name(start, interval)} PARTITION OF {staging} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+    cursor.execute(f'INSERT INTO {staging} SELECT * FROM {TABLE}')
+    cursor.execute(f'DROP TABLE {TABLE}')
+    cursor.execute(f'ALTER TABLE {staging} RENAME TO {TABLE}')
+
+    cursor.execute(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+    cursor.execute('SELECT setval(%s, %s, %s)', [SEQUENCE, max(max_id, 1), max_id > 0])
+    add_constraints(cursor, ['id', 'date'], foreign_key)
+
+
+def unpartition_table(cursor):
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    foreign_key = foreign_key_name(cursor)
+    staging = f'{TABLE}_plain'
+    cursor.execute(f'CREATE TABLE {staging} (LIKE {TABLE})')
+    cursor.execute(f'INSERT INTO {staging} SELECT * FROM {TABLE}')
+    cursor.execute(f'SELECT COALESCE(max(id), 0) + 1 FROM {TABLE}')
+    next_id = cursor.fetchone()[0]
+    cursor.execute(f'DROP TABLE {TABLE}')
+    cursor.execute(f'ALTER TABLE {staging} RENAME TO {TABLE}')
+    # The identity column Django created in 0001, continuing after max(id).
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {int(next_id)})'
+    )
+    add_constraints(cursor, ['id'], foreign_key)
+
+
+# Opt-in: only converts when HABIT_RECORDS_PARTITIONING is set, on Postgres,
+# at the time this migration is applied. A database migrated without it
+# stays plain; partition it later with `manage.py habit_partitions --convert
+# month|year`. The model is unchanged; the layout lives below the ORM.
+def partition(apps, schema_editor):
+    interval = settings.HABIT_RECORDS_PARTITIONING
+    if schema_editor.connection.vendor != 'postgresql' or not interval:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            convert(cursor, interval, settings.HABIT_RECORDS_PARTITIONS_AHEAD)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            unpartition_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0005_dailyrecord_covering_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
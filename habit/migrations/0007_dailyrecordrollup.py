@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_hits(apps, schema_editor):
+    DailyRecord = apps.get_model('habit', 'DailyRecord')
+    HabitStats = apps.get_model('habit', 'HabitStats')
+
+    hits = (
+        DailyRecord.objects.filter(habit_id=models.OuterRef('habit_id'), amount_achieved__gte=models.F('habit__target'))
+        .values('habit_id')
+        .annotate(count=models.Count('id'))
+        .values('count')
+    )
+    HabitStats.objects.update(hits=Coalesce(models.Subquery(hits), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0006_partition_dailyrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habitstats',
+            name='hits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_hits, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='DailyRecordRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('count', models.IntegerField()),
+                ('total', models.BigIntegerField()),
+                ('best', models.IntegerField()),
+                ('hits', models.IntegerField(default=0)),
+                ('first_hit', models.DateField(null=True)),
+                ('last_hit', models.DateField(null=True)),
+                ('first_run', models.IntegerField(default=0)),
+                ('last_run', models.IntegerField(default=0)),
+                ('longest_run', models.IntegerField(default=0)),
+                ('amounts', models.JSONField()),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='habit.habit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('habit', 'period_start'), name='unique_record_rollup')],
+            },
+        ),
+    ]
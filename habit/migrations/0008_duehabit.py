@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habit', '0007_dailyrecordrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DueHabit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('target', models.IntegerField()),
+                ('amount_achieved', models.IntegerField(null=True)),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='due_days', to='habit.habit')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='due_habits', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'date'], name='duehabit_user_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('habit', 'date'), name='unique_due_habit')],
+            },
+        ),
+    ]
@@ -1,9 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.conf import settings
 
 class Habit(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL,related_name='habits',on_delete=models.CASCADE)
+    # Indexed by habit_user_id_idx below instead of a separate FK index.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,related_name='habits',on_delete=models.CASCADE,db_index=False)
     name = models.CharField(max_length=20)
     description = models.CharField(max_length=100)
     target = models.IntegerField(validators=[MinValueValidator(1)])
@@ -13,13 +14,55 @@ class Habit(models.Model):
     def __str__(self):
         return f'{self.name} {self.user.username}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_target = instance.__dict__.get('target')
+        return instance
+
+    def target_changed(self):
+        loaded = getattr(self, '_loaded_target', None)
+        return loaded is not None and loaded != self.target
+
+    # A target change re-evaluates success and the stats row in post_save.
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            # Loaded with target deferred (or built by hand): read the stored
+            # value before it is overwritten, so a change is still seen.
+            if (
+                self.pk is not None
+                and getattr(self, '_loaded_target', None) is None
+                and 'target' in self.__dict__
+                and (update_fields is None or 'target' in update_fields)
+            ):
+                self._loaded_target = Habit.objects.filter(pk=self.pk).values_list('target', flat=True).first()
+            super().save(*args, **kwargs)
+        self._loaded_target = self.__dict__.get('target')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='habit_user_id_idx'),
+        ]
+
 class DailyRecord(models.Model):
-    habit = models.ForeignKey(Habit,related_name='daily_records',on_delete=models.CASCADE)
+    # unique_daily_record leads with habit_id and serves FK lookups.
+    habit = models.ForeignKey(Habit,related_name='daily_records',on_delete=models.CASCADE,db_index=False)
     date = models.DateField()
     amount_achieved = models.IntegerField(validators=[MinValueValidator(0)])
 
     def __str__(self):
         return f'{self.habit.name} on {self.date}: {self.amount_achieved}/{self.habit.target}'
+
+    # Signal receivers keep HabitStats in step with the records, so they must
+    # run in the same transaction as the write itself.
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
     class Meta:
         constraints = [
@@ -28,4 +71,88 @@ class DailyRecord(models.Model):
                 name = 'unique_daily_record',
             )
         ]
+        indexes = [
+            # INCLUDE lets the records window, the success EXISTS check and
+            # the stats aggregates run as index-only scans on Postgres; other
+            # backends get a plain (habit, -date) index.
+            models.Index(
+                fields=['habit', '-date'],
+                include=['amount_achieved'],
+                name='dailyrecord_habit_date_cover',
+            ),
+        ]
+
+
+class HabitStats(models.Model):
+    habit = models.OneToOneField(Habit,primary_key=True,related_name='stats',on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+    total = models.BigIntegerField(null=True)
+    best = models.IntegerField(null=True)
+    average = models.FloatField(null=True)
+    success = models.BooleanField(default=False)
+    current_streak = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    last_hit = models.DateField(null=True)
+    hits = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'Stats for habit {self.habit_id}'
+
+
+class DailyRecordRollup(models.Model):
+    # Records older than HABIT_ROLLUP_HORIZON_DAYS folded into one row per
+    # habit and week or month by `manage.py compact_records`. The hit columns
+    # describe the on-target days at compaction time: first/last hit and the
+    # runs of consecutive hits starting at the first and ending at the last
+    # one, so streaks can be stitched across periods and recent raw records.
+    habit = models.ForeignKey(Habit,related_name='rollups',on_delete=models.CASCADE,db_index=False)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    count = models.IntegerField()
+    total = models.BigIntegerField()
+    best = models.IntegerField()
+    hits = models.IntegerField(default=0)
+    first_hit = models.DateField(null=True)
+    last_hit = models.DateField(null=True)
+    first_run = models.IntegerField(default=0)
+    last_run = models.IntegerField(default=0)
+    longest_run = models.IntegerField(default=0)
+    # [day offset from period_start, amount_achieved] per compacted record,
+    # so the hit columns can be recomputed when the target changes.
+    amounts = models.JSONField()
+
+    def __str__(self):
+        return f'{self.habit_id} {self.period_start}..{self.period_end}: {self.count} records'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['habit','period_start'],
+                name = 'unique_record_rollup',
+            )
+        ]
+
+
+class DueHabit(models.Model):
+    # Habits without an on-target record on `date`, written in bulk per chunk
+    # of users by `manage.py compute_due` (habit/due.py). amount_achieved is
+    # null when nothing was logged that day.
+    date = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,related_name='due_habits',on_delete=models.CASCADE,db_index=False)
+    habit = models.ForeignKey(Habit,related_name='due_days',on_delete=models.CASCADE,db_index=False)
+    target = models.IntegerField()
+    amount_achieved = models.IntegerField(null=True)
 
+    def __str__(self):
+        return f'{self.habit_id} due on {self.date}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['habit','date'],
+                name = 'unique_due_habit',
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='duehabit_user_date_idx'),
+        ]
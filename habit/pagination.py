@@ -0,0 +1,140 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Seeks with WHERE (a, b) > (x, y) on the ordering columns instead of
+    # OFFSET, so every page costs the same index range scan.
+    ordering = ('id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek(queryset, request)
+        return self.paginate_results(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek(queryset, request)
+        return self.paginate_results([obj async for obj in queryset[:self.page_size + 1]])
+
+    def seek(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        position, self.reverse = self.decode_cursor(request)
+        self.has_cursor = position is not None
+
+        if self.reverse:
+            queryset = queryset.order_by(*(f'-{field}' for field in self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position, self.reverse))
+        return queryset
+
+    def paginate_results(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        if requested > 0:
+            page_size = requested
+        return min(page_size, settings.HABIT_MAX_PAGE_SIZE)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.position_of(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self.position_of(self.page[0]), reverse=True)
+
+    def position_of(self, obj):
+        if isinstance(obj, dict):
+            return [obj[field] for field in self.ordering]
+        return [getattr(obj, field) for field in self.ordering]
+
+    def seek_filter(self, position, reverse):
+        lookup = 'lt' if reverse else 'gt'
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            equal = {name: value for name, value in zip(self.ordering[:index], position)}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': position[index]}))
+        return reduce(or_, conditions)
+
+    def encode_cursor(self, position, reverse):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+
+class HabitPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class DailyRecordPagination(KeysetPagination):
+    ordering = ('date', 'id')
@@ -0,0 +1,208 @@
+import re
+from datetime import date
+
+from django.conf import settings
+
+from .models import DailyRecord, Habit
+from .services import records_changed
+
+# Optional Postgres layout for habit_dailyrecord: PARTITION BY RANGE (date)
+# with one partition per month or year plus a DEFAULT partition that catches
+# rows outside the created ranges. Partitioned tables need the partition key
+# in every unique constraint, so the primary key becomes (id, date); ids
+# still come from a single sequence. unique_daily_record already includes
+# date and stays enforced across partitions.
+
+TABLE = DailyRecord._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+SEQUENCE = f'{TABLE}_id_seq'
+INTERVALS = ('month', 'year')
+
+BOUNDS = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def period_start(day, interval):
+    if interval == 'year':
+        return date(day.year, 1, 1)
+    return date(day.year, day.month, 1)
+
+
+def next_period(start, interval):
+    if interval == 'year':
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    if interval == 'year':
+        return f'{TABLE}_y{start.year}'
+    return f'{TABLE}_y{start.year}m{start.month:02d}'
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [TABLE])
+    return cursor.fetchone()[0] == 'p'
+
+
+def list_partitions(cursor):
+    # [(name, start, end)], start and end are None for the DEFAULT partition.
+    cursor.execute(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass',
+        [TABLE],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = BOUNDS.search(bound)
+        if match is None:
+            partitions.append((name, None, None))
+        else:
+            partitions.append((name, date.fromisoformat(match[1]), date.fromisoformat(match[2])))
+    return sorted(partitions, key=lambda partition: partition[1] or date.min)
+
+
+def partition_interval(partitions):
+    for name, start, end in partitions:
+        if start is not None:
+            return 'month' if (end - start).days <= 31 else 'year'
+    return settings.HABIT_RECORDS_PARTITIONING or 'month'
+
+
+def create_partition(cursor, start, interval):
+    # Rows for the range may already sit in the DEFAULT partition: move them
+    # into the new table before attaching it.
+    name = partition_name(start, interval)
+    end = next_period(start, interval)
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    return name
+
+
+def ensure_partitions(cursor, today=None, ahead=None):
+    # Partitions for the current period, `ahead` periods after it, and any
+    # period that has collected rows in the DEFAULT partition.
+    if not is_partitioned(cursor):
+        return []
+    today = today or date.today()
+    ahead = settings.HABIT_RECORDS_PARTITIONS_AHEAD if ahead is None else ahead
+    partitions = list_partitions(cursor)
+    interval = partition_interval(partitions)
+    existing = {start for _, start, _ in partitions if start is not None}
+
+    wanted = set()
+    start = period_start(today, interval)
+    for _ in range(ahead + 1):
+        wanted.add(start)
+        start = next_period(start, interval)
+    cursor.execute(f'SELECT DISTINCT date_trunc(%s, date)::date FROM {DEFAULT_PARTITION}', [interval])
+    wanted.update(row[0] for row in cursor.fetchall())
+
+    return [create_partition(cursor, start, interval) for start in sorted(wanted - existing)]
+
+
+def foreign_key_name(cursor):
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [TABLE],
+    )
+    return cursor.fetchone()[0]
+
+
+def add_constraints(cursor, primary_key, foreign_key):
+    habits = Habit._meta.db_table
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({", ".join(primary_key)})')
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT unique_daily_record UNIQUE (habit_id, date)')
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {foreign_key} FOREIGN KEY (habit_id) '
+        f'REFERENCES {habits} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(
+        f'CREATE INDEX dailyrecord_habit_date_cover ON {TABLE} (habit_id, date DESC) INCLUDE (amount_achieved)'
+    )
+
+
+def convert(cursor, interval, today=None, ahead=None):
+    # Rebuilds habit_dailyrecord as a partitioned table holding the same rows.
+    # Runs under an exclusive lock; meant for a migration or maintenance window.
+    if interval not in INTERVALS:
+        raise ValueError(f'interval must be one of {INTERVALS}')
+    today = today or date.today()
+    ahead = settings.HABIT_RECORDS_PARTITIONS_AHEAD if ahead is None else ahead
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    foreign_key = foreign_key_name(cursor)
+    cursor.execute(f'SELECT min(date), COALESCE(max(id), 0) FROM {TABLE}')
+    first_day, max_id = cursor.fetchone()
+
+    staging = f'{TABLE}_partitioned'
+    cursor.execute(f'CREATE TABLE {staging} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (date)')
+    cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging} DEFAULT')
+    start = period_start(min(first_day or today, today), interval)
+    last = period_start(today, interval)
+    for _ in range(ahead):
+        last = next_period(last, interval)
+    while start <= last:
+        end = next_period(start, interval)
+        cursor.execute(
+            f"CREATE TABLE {partition_name(start, interval)} PARTITION OF {staging} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+    cursor.execute(f'INSERT INTO {staging} SELECT * FROM {TABLE}')
+    cursor.execute(f'DROP TABLE {TABLE}')
+    cursor.execute(f'ALTER TABLE {staging} RENAME TO {TABLE}')
+
+    cursor.execute(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+    cursor.execute('SELECT setval(%s, %s, %s)', [SEQUENCE, max(max_id, 1), max_id > 0])
+    add_constraints(cursor, ['id', 'date'], foreign_key)
+
+
+def unpartition(cursor):
+    # Back to a plain table (the reverse of migration 0006).
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+    foreign_key = foreign_key_name(cursor)
+    staging = f'{TABLE}_plain'
+    cursor.execute(f'CREATE TABLE {staging} (LIKE {TABLE})')
+    cursor.execute(f'INSERT INTO {staging} SELECT * FROM {TABLE}')
+    cursor.execute(f'SELECT COALESCE(max(id), 0) + 1 FROM {TABLE}')
+    next_id = cursor.fetchone()[0]
+    cursor.execute(f'DROP TABLE {TABLE}')
+    cursor.execute(f'ALTER TABLE {staging} RENAME TO {TABLE}')
+    # The identity column Django created in 0001, continuing after max(id).
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {int(next_id)})'
+    )
+    add_constraints(cursor, ['id'], foreign_key)
+
+
+def remove_partitions(cursor, before, drop=False):
+    # Detaches (or drops) every range partition that ends on or before
+    # `before`. Detached tables are kept as <name>_detached for archiving.
+    # The records disappear from the API, so success, stats and cache
+    # versions of the affected habits are refreshed.
+    removed = []
+    habit_ids = set()
+    for name, start, end in list_partitions(cursor):
+        if end is None or end > before:
+            continue
+        cursor.execute(f'SELECT DISTINCT habit_id FROM {name}')
+        habit_ids.update(row[0] for row in cursor.fetchall())
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+        else:
+            cursor.execute(f'ALTER TABLE {name} RENAME TO {name}_detached')
+        removed.append(name)
+
+    habit_ids = sorted(habit_ids)
+    user_ids = sorted(set(Habit.objects.filter(id__in=habit_ids).values_list('user_id', flat=True)))
+    records_changed(habit_ids, user_ids)
+    return removed
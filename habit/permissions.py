@@ -1,9 +1,11 @@
 from rest_framework import permissions
 
 class IsOwner(permissions.BasePermission):
+    # Compares ids only: neither the user row nor (for records) the habit's
+    # user is loaded. Records must come with their habit selected.
     def has_object_permission(self, request, view, obj):
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
-        elif hasattr(obj, 'habit'):
-            return obj.habit.user == request.user
-        return False
\ No newline at end of file
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.pk
+        elif hasattr(obj, 'habit_id'):
+            return obj.habit.user_id == request.user.pk
+        return False
@@ -0,0 +1,64 @@
+import msgpack
+import orjson
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+# DRF's encoder covers everything orjson and msgpack do not handle natively
+# (lazy strings, Decimal, timedelta, querysets) the same way JSONRenderer does.
+default = JSONEncoder().default
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    # Same output as JSONRenderer (compact, UTF-8, dates as ISO strings,
+    # U+2028/U+2029 escaped, int/float/bool/None keys as strings); ?indent /
+    # "; indent=" requests and integers beyond 64 bits fall back to it. Floats
+    # of the same value may be spelled differently: 1e16 instead of 1e+16,
+    # 1e-7 instead of 1e-07, 0.000025 instead of 2.5e-05. Where JSONRenderer
+    # raises, NaN and Infinity render as null and keys such as dates as strings.
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            body = orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Valid JSON, but not valid inside JavaScript source.
+        if b'\xe2\x80' in body:
+            body = body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return body
+
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=default)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,94 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import get_version, version_timestamp
+
+# Rows that must be readable right after they were written by another
+# request: djoser's login creates the token the next request sends.
+PRIMARY_APPS = {'authtoken', 'sessions'}
+
+# Alias the reads of the current request go to, set by
+# ReplicaRoutingMiddleware. Outside requests (management commands, shells)
+# it is None and reads use the primary, which never lags behind.
+read_alias = ContextVar('habit_read_alias', default=None)
+
+
+def choose_replica():
+    replicas = settings.HABIT_READ_REPLICAS
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+def pin_primary():
+    read_alias.set(DEFAULT_DB_ALIAS)
+
+
+def copy_primary(alias):
+    # Stand-in for streaming replication between SQLite files (SQLITE_REPLICAS):
+    # overwrites the replica with the primary's current contents.
+    primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ValueError(f'{alias} is not an SQLite copy of the primary.')
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
+
+
+def version_settled(version):
+    # Rows read from a replica only reflect the writes behind markers older
+    # than HABIT_REPLICA_MAX_LAG_SECONDS. Until then an ETag or cache entry
+    # keyed by the marker could hold older data and outlive the lag.
+    if read_alias.get() in (None, DEFAULT_DB_ALIAS):
+        return True
+    return time.time() - version_timestamp(version) >= settings.HABIT_REPLICA_MAX_LAG_SECONDS
+
+
+def wrote_recently(user_id):
+    # Every write bumps the user's version marker (habit/cache.py), whose
+    # timestamp therefore tells when the user last changed anything.
+    version = get_version('user', user_id)
+    return time.time() - version_timestamp(version) < settings.HABIT_REPLICA_PIN_SECONDS
+
+
+class ReplicaRouter:
+    # Reads of requests go to HABIT_READ_REPLICAS, everything else to the
+    # primary. Reads inside a transaction on the primary (signal receivers,
+    # services, compaction) stay there so they see the writes they follow.
+
+    def db_for_read(self, model, **hints):
+        if not settings.HABIT_READ_REPLICAS or model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMixin:
+    # Once the user is known, pins the rest of the request to the primary
+    # if they wrote within HABIT_REPLICA_PIN_SECONDS, so replica lag never
+    # hides their own changes.
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if settings.HABIT_READ_REPLICAS and request.user.is_authenticated and wrote_recently(request.user.pk):
+            pin_primary()
+
+    async def ainitial(self, request, *args, **kwargs):
+        await super().ainitial(request, *args, **kwargs)
+        if settings.HABIT_READ_REPLICAS and request.user.is_authenticated:
+            if await sync_to_async(wrote_recently, thread_sensitive=False)(request.user.pk):
+                pin_primary()
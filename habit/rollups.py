@@ -0,0 +1,175 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .cache import bump_versions
+from .models import Habit, DailyRecord, DailyRecordRollup
+from .stats import fold_runs, iter_habit_ids
+
+PERIODS = ('week', 'month')
+COMPACT_BATCH_SIZE = 1000
+HIT_FIELDS = [
+    'hits',
+    'first_hit',
+    'last_hit',
+    'first_run',
+    'last_run',
+    'longest_run',
+]
+ROLLUP_FIELDS = [
+    'period_end',
+    'count',
+    'total',
+    'best',
+    'amounts',
+    *HIT_FIELDS,
+]
+
+
+class CompactedHistory(ValueError):
+    def __init__(self, habit_id, horizon):
+        super().__init__(f'Habit {habit_id}: records up to {horizon.isoformat()} are compacted and cannot be written.')
+
+
+def compacted_until(habit_ids):
+    # {habit_id: last day covered by its rollups} for habits with any.
+    return dict(
+        DailyRecordRollup.objects.filter(habit_id__in=habit_ids)
+        .values('habit_id')
+        .annotate(end=Max('period_end'))
+        .values_list('habit_id', 'end')
+    )
+
+
+def reject_compacted(records, horizons=None):
+    # records are (habit_id, date) pairs about to be written. A compacted
+    # period only keeps its totals, so a raw record for one of its days would
+    # be counted on top of them. horizons may come from compacted_until().
+    records = list(records)
+    if horizons is None:
+        horizons = compacted_until({habit_id for habit_id, _ in records})
+    for habit_id, day in records:
+        if habit_id in horizons and day <= horizons[habit_id]:
+            raise CompactedHistory(habit_id, horizons[habit_id])
+
+
+def period_bounds(day, period):
+    if period == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    following = (start + timedelta(days=31)).replace(day=1)
+    return start, following - timedelta(days=1)
+
+
+def rollup_records(rollup):
+    # The compacted (date, amount_achieved) pairs, stored as day offsets.
+    return [(rollup.period_start + timedelta(days=offset), amount) for offset, amount in rollup.amounts]
+
+
+def build_rollup(habit_id, period_start, period_end, records, target, existing=()):
+    # records are the (date, amount_achieved) rows of one habit and period.
+    # Existing rollups starting inside the period (records written after an
+    # earlier compaction, or weeks compacted before switching to months) are
+    # merged: their stored amounts join the records.
+    merged = {}
+    for earlier in existing:
+        merged.update(rollup_records(earlier))
+    # A raw record replaces a compacted one of the same day.
+    merged.update(records)
+    records = sorted(merged.items())
+    amounts = [amount for _, amount in records]
+    segments = [(day, day, 1, 1, 1) for day, amount in records if amount >= target]
+    rollup = DailyRecordRollup(
+        habit_id=habit_id,
+        period_start=period_start,
+        period_end=max([period_end, *(earlier.period_end for earlier in existing)]),
+        count=len(amounts),
+        total=sum(amounts),
+        best=max(amounts),
+        hits=len(segments),
+        amounts=[[(day - period_start).days, amount] for day, amount in records],
+    )
+    if segments:
+        rollup.first_hit, rollup.last_hit, rollup.first_run, rollup.last_run, rollup.longest_run = fold_runs(segments)
+    return rollup
+
+
+def retarget_rollups(habit_id, target):
+    # Recomputes the hit columns of a habit's rollups for a new target from
+    # the stored amounts.
+    rollups = list(DailyRecordRollup.objects.filter(habit_id=habit_id))
+    for rollup in rollups:
+        fresh = build_rollup(habit_id, rollup.period_start, rollup.period_end, rollup_records(rollup), target)
+        for field in HIT_FIELDS:
+            setattr(rollup, field, getattr(fresh, field))
+    DailyRecordRollup.objects.bulk_update(rollups, HIT_FIELDS)
+
+
+def compact_habits(habit_ids, cutoff, period):
+    # Folds the records dated before cutoff into rollups and deletes them.
+    # Every statistic is carried over, so HabitStats and success stay as
+    # they are; only the cached record lists go stale.
+    rows = (
+        DailyRecord.objects.filter(habit_id__in=habit_ids, date__lt=cutoff)
+        .order_by('habit_id', 'date')
+        .values_list('habit_id', 'date', 'amount_achieved', 'habit__target')
+    )
+    groups = defaultdict(list)
+    targets = {}
+    for habit_id, day, amount, target in rows.iterator(chunk_size=5000):
+        groups[habit_id, *period_bounds(day, period)].append((day, amount))
+        targets[habit_id] = target
+    if not groups:
+        return 0, 0
+
+    compacted = set(targets)
+    existing = defaultdict(list)
+    rollups = DailyRecordRollup.objects.filter(
+        habit_id__in=compacted,
+        period_start__gte=min(start for _, start, _ in groups),
+        period_start__lt=cutoff,
+    )
+    for rollup in rollups:
+        existing[rollup.habit_id].append(rollup)
+
+    rollups = []
+    merged = []
+    for (habit_id, start, end), records in groups.items():
+        inside = [rollup for rollup in existing[habit_id] if start <= rollup.period_start <= end]
+        rollups.append(build_rollup(habit_id, start, end, records, targets[habit_id], inside))
+        merged += [rollup.pk for rollup in inside if rollup.period_start != start]
+    DailyRecordRollup.objects.filter(pk__in=merged).delete()
+    DailyRecordRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['habit', 'period_start'],
+        update_fields=ROLLUP_FIELDS,
+    )
+    # A plain DELETE: the per-row post_delete receivers would rebuild the
+    # very statistics the rollups preserve.
+    placeholders = ', '.join(['%s'] * len(compacted))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(DailyRecord._meta.db_table)} '
+            f'WHERE habit_id IN ({placeholders}) AND date < %s',
+            [*compacted, cutoff],
+        )
+        deleted = cursor.rowcount
+
+    compacted = sorted(compacted)
+    bump_versions('habit', compacted)
+    bump_versions('user', sorted(set(Habit.objects.filter(id__in=compacted).values_list('user_id', flat=True))))
+    return deleted, len(rollups)
+
+
+def compact_records(before, period, batch_size=COMPACT_BATCH_SIZE):
+    # Only whole periods are compacted: cutoff is the start of the period
+    # that contains `before`. One transaction per batch of habits.
+    cutoff, _ = period_bounds(before, period)
+    for habit_ids in iter_habit_ids(batch_size):
+        with transaction.atomic():
+            deleted, rollups = compact_habits(habit_ids, cutoff, period)
+        yield habit_ids, deleted, rollups
@@ -1,7 +1,18 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Habit,DailyRecord
+from .series import BUCKETS, DEFAULT_BUCKETS, bucket_count, buckets_back
+from .metrics import measure_serialization
 
-class DailyRecordSerializer(serializers.ModelSerializer):
+class MeasuredSerializerMixin:
+    # Per object, so for many=True the queryset is fetched before timing starts.
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+class DailyRecordSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     target = serializers.IntegerField(source='habit.target',read_only=True)
     unit = serializers.CharField(source = 'habit.unit',read_only=True)
 
@@ -17,12 +28,39 @@ class DailyRecordSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('id',)
 
-class HabitSerializer(serializers.ModelSerializer):
-    user = serializers.StringRelatedField(read_only=True)
+class RecordAmountSerializer(serializers.Serializer):
+    amount_achieved = serializers.IntegerField(min_value=0)
+
+class RecordIncrementSerializer(serializers.Serializer):
+    # May be negative; the stored amount stops at zero.
+    amount = serializers.IntegerField(default=1)
+
+class DueSerializer(serializers.Serializer):
+    # ?date= for habits/due/, today when missing.
+    date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        return {'date': attrs.get('date') or timezone.localdate()}
+
+class DailyRecordBulkSerializer(serializers.Serializer):
+    # Plain fields on purpose: a PrimaryKeyRelatedField and the unique
+    # together validator would each cost a query per row.
+    habit = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    amount_achieved = serializers.IntegerField(min_value=0)
+
+class HabitSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
+    # Optional groups for ?expand=; everything else is a plain habit column.
+    EXPANSIONS = {
+        'daily_records': ('daily_records',),
+        'stats': ('total', 'average', 'best'),
+    }
+
+    user = serializers.CharField(source='user.username',read_only=True)
     daily_records = serializers.SerializerMethodField() 
-    total = serializers.IntegerField(read_only=True)
-    average = serializers.FloatField(read_only=True )
-    best = serializers.IntegerField(read_only=True)
+    total = serializers.IntegerField(source='stats.total',read_only=True,allow_null=True)
+    average = serializers.FloatField(source='stats.average',read_only=True,allow_null=True)
+    best = serializers.IntegerField(source='stats.best',read_only=True,allow_null=True)
 
     class Meta:
         model = Habit
@@ -40,6 +78,12 @@ class HabitSerializer(serializers.ModelSerializer):
             'success'
         ]
         read_only_fields = ('id','user') 
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
     
     def get_daily_records(self, obj):
         records = getattr(obj, 'prefetched_daily_records', None)
@@ -53,3 +97,77 @@ class HabitSerializer(serializers.ModelSerializer):
             }
             for record in records
         ]
+
+
+class RecordsWindowSerializer(serializers.Serializer):
+    records_from = serializers.DateField(required=False)
+    records_to = serializers.DateField(required=False)
+    records_limit = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_records_limit(self, value):
+        return min(value, settings.HABIT_MAX_RECORDS_LIMIT)
+
+    def validate(self, attrs):
+        records_to = attrs.get('records_to')
+        if 'records_from' not in attrs:
+            window = timedelta(days=settings.HABIT_RECORDS_WINDOW_DAYS - 1)
+            attrs['records_from'] = (records_to or timezone.localdate()) - window
+        if records_to is not None and attrs['records_from'] > records_to:
+            raise serializers.ValidationError('records_from must not be after records_to.')
+        attrs.setdefault('records_limit', settings.HABIT_RECORDS_LIMIT)
+        return attrs
+
+
+class HabitFieldsSerializer(serializers.Serializer):
+    # ?fields=a,b picks fields, ?expand=daily_records,stats adds the groups.
+    # Without either the full representation is returned.
+    fields = serializers.CharField(required=False, allow_blank=True)
+    expand = serializers.CharField(required=False, allow_blank=True)
+
+    def split(self, value):
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def validate_fields(self, value):
+        names = self.split(value)
+        unknown = names - set(HabitSerializer.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError(f'Unknown fields: {", ".join(sorted(unknown))}.')
+        return names
+
+    def validate_expand(self, value):
+        names = self.split(value)
+        unknown = names - set(HabitSerializer.EXPANSIONS)
+        if unknown:
+            raise serializers.ValidationError(f'Unknown expansions: {", ".join(sorted(unknown))}.')
+        return names
+
+    def validate(self, attrs):
+        if 'fields' not in attrs and 'expand' not in attrs:
+            return {'fields': None}
+        expanded = {name for group in HabitSerializer.EXPANSIONS.values() for name in group}
+        fields = attrs.get('fields', set(HabitSerializer.Meta.fields) - expanded)
+        for group in attrs.get('expand', ()):
+            fields |= set(HabitSerializer.EXPANSIONS[group])
+        return {'fields': fields}
+
+
+class SeriesSerializer(serializers.Serializer):
+    # ?bucket=day|week|month&from=&to=; `from` is a keyword, hence get_fields.
+    def get_fields(self):
+        return {
+            'bucket': serializers.ChoiceField(choices=list(BUCKETS), default='day'),
+            'from': serializers.DateField(required=False),
+            'to': serializers.DateField(required=False),
+        }
+
+    def validate(self, attrs):
+        bucket = attrs['bucket']
+        end = attrs.get('to') or timezone.localdate()
+        start = attrs.get('from') or buckets_back(end, bucket, DEFAULT_BUCKETS[bucket])
+        if start > end:
+            raise serializers.ValidationError('from must not be after to.')
+        if bucket_count(start, end, bucket) > settings.HABIT_SERIES_MAX_BUCKETS:
+            raise serializers.ValidationError(
+                f'At most {settings.HABIT_SERIES_MAX_BUCKETS} buckets; use a larger bucket or a shorter range.'
+            )
+        return {'bucket': bucket, 'start': start, 'end': end}
@@ -0,0 +1,145 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import DailyRecord, DailyRecordRollup
+
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+# Range used when ?from= is missing, counted back from ?to= (today).
+DEFAULT_BUCKETS = {
+    'day': 30,
+    'week': 12,
+    'month': 12,
+}
+METRICS = ['count', 'total', 'average', 'best', 'hits']
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start + timedelta(days=31)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def buckets_back(end, bucket, count):
+    # Start of the bucket `count - 1` buckets before the one holding end.
+    start = bucket_start(end, bucket)
+    if bucket == 'month':
+        months = start.year * 12 + start.month - count
+        return start.replace(year=months // 12, month=months % 12 + 1)
+    step = 7 if bucket == 'week' else 1
+    return start - timedelta(days=step * (count - 1))
+
+
+def bucket_count(start, end, bucket):
+    if bucket == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    step = 7 if bucket == 'week' else 1
+    return (bucket_start(end, bucket) - bucket_start(start, bucket)).days // step + 1
+
+
+def bucket_dates(start, end, bucket):
+    dates = []
+    day = bucket_start(start, bucket)
+    while day <= end:
+        dates.append(day)
+        day = next_bucket(day, bucket)
+    return dates
+
+
+def aggregate_buckets(habit_ids, bucket, start, end):
+    # One statement: the records GROUP BY (habit, bucket), plus the compacted
+    # rollups overlapping the range, grouped by the bucket they start in.
+    # first/last are the days each row covers, so build_series can tell
+    # rollups that do not fit inside one bucket of the range.
+    trunc = BUCKETS[bucket]
+    rows = (
+        DailyRecord.objects.filter(habit_id__in=habit_ids, date__gte=start, date__lte=end)
+        .annotate(bucket=trunc('date'))
+        .values('habit_id', 'bucket')
+        .annotate(
+            count=Count('id'),
+            total=Sum('amount_achieved'),
+            best=Max('amount_achieved'),
+            hits=Count('id', filter=Q(amount_achieved__gte=F('habit__target'))),
+            first=Min('date'),
+            last=Max('date'),
+        )
+        .order_by()
+    )
+    rolled = (
+        DailyRecordRollup.objects.filter(habit_id__in=habit_ids, period_end__gte=start, period_start__lte=end)
+        .annotate(bucket=trunc('period_start'))
+        .values('habit_id', 'bucket')
+        .annotate(
+            count=Sum('count'),
+            total=Sum('total'),
+            best=Max('best'),
+            hits=Sum('hits'),
+            first=Min('period_start'),
+            last=Max('period_end'),
+        )
+        .order_by()
+    )
+    return rows.union(rolled, all=True)
+
+
+def build_series(habit_ids, bucket, start, end):
+    # Columnar layout: the bucket start dates once, then one array per
+    # metric and habit aligned with them. Empty buckets hold zero counts
+    # and null averages/bests. Buckets sharing a rollup with another bucket
+    # or with days outside the range cannot be split out of its totals and
+    # hold null in every metric.
+    dates = bucket_dates(start, end, bucket)
+    index = {day: position for position, day in enumerate(dates)}
+    columns = {}
+    for habit_id in habit_ids:
+        columns[habit_id] = {
+            metric: [None if metric in ('average', 'best') else 0] * len(dates)
+            for metric in METRICS
+        }
+
+    sums = defaultdict(lambda: [0, 0, None, 0])
+    unavailable = set()
+    for row in aggregate_buckets(habit_ids, bucket, dates[0], end):
+        first = bucket_start(row['first'], bucket)
+        last = bucket_start(row['last'], bucket)
+        if first != last or row['first'] < dates[0] or row['last'] > end:
+            day = max(first, dates[0])
+            while day <= min(last, dates[-1]):
+                unavailable.add((row['habit_id'], day))
+                day = next_bucket(day, bucket)
+            continue
+        item = sums[row['habit_id'], first]
+        item[0] += row['count']
+        item[1] += row['total']
+        item[2] = row['best'] if item[2] is None else max(item[2], row['best'])
+        item[3] += row['hits']
+    for (habit_id, day), (count, total, best, hits) in sums.items():
+        position = index[day]
+        series = columns[habit_id]
+        series['count'][position] = count
+        series['total'][position] = total
+        series['average'][position] = total / count
+        series['best'][position] = best
+        series['hits'][position] = hits
+    for habit_id, day in unavailable:
+        position = index[day]
+        for metric in METRICS:
+            columns[habit_id][metric][position] = None
+    return dates, columns
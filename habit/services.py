@@ -0,0 +1,152 @@
+from django.db import connections, router, transaction
+from django.db.models import Exists, Max, Min, OuterRef, Subquery
+
+from .models import Habit, DailyRecord, DailyRecordRollup, HabitStats
+from .stats import STATS_FIELDS, fold_record, rebuild_stats
+from .rollups import CompactedHistory, compacted_until
+from .cache import bump_versions
+
+UPSERT_BATCH_SIZE = 1000
+SUCCESS_BATCH_SIZE = 10000
+
+
+def has_hits(habit):
+    # Rollups are read through their hit columns, exactly as compute_stats
+    # reads them, so success and the stats row always agree.
+    return (
+        habit.daily_records.filter(amount_achieved__gte=habit.target).exists()
+        or habit.rollups.filter(hits__gt=0).exists()
+    )
+
+
+def _refresh_success(habits):
+    # UPDATE habit_habit SET success = EXISTS(...) and copy the result onto
+    # the stats rows; no model instances are loaded.
+    hits = DailyRecord.objects.filter(habit_id=OuterRef('pk'), amount_achieved__gte=OuterRef('target'))
+    rolled_hits = DailyRecordRollup.objects.filter(habit_id=OuterRef('pk'), hits__gt=0)
+    updated = habits.update(success=Exists(hits) | Exists(rolled_hits))
+    success = Habit.objects.filter(pk=OuterRef('habit_id')).values('success')
+    HabitStats.objects.filter(habit__in=habits).update(success=Subquery(success))
+    return updated
+
+
+def refresh_success(habit_ids):
+    return _refresh_success(Habit.objects.filter(id__in=habit_ids))
+
+
+def recompute_success(batch_size=SUCCESS_BATCH_SIZE):
+    # Walks the id space in fixed ranges, one transaction per range, so the
+    # cost per statement stays bounded however many habits there are.
+    bounds = Habit.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic():
+            updated = _refresh_success(Habit.objects.filter(id__gte=start, id__lt=start + batch_size))
+        yield start, start + batch_size - 1, updated
+
+
+def upsert_records(user_id, records):
+    # records are (habit_id, date, amount_achieved) tuples whose habits have
+    # already been checked to belong to user_id.
+    latest = latest_records(records)
+    with transaction.atomic():
+        write_records(latest)
+        habit_ids = sorted({habit_id for habit_id, _ in latest})
+        records_changed(habit_ids, [user_id])
+    return len(latest), habit_ids
+
+
+def latest_records(records):
+    # A later duplicate of the same (habit, date) wins, since one
+    # INSERT ... ON CONFLICT cannot touch the same row twice.
+    return {(habit_id, day): amount for habit_id, day, amount in records}
+
+
+def write_records(latest):
+    DailyRecord.objects.bulk_create(
+        [
+            DailyRecord(habit_id=habit_id, date=day, amount_achieved=amount)
+            for (habit_id, day), amount in latest.items()
+        ],
+        batch_size=UPSERT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['habit', 'date'],
+        update_fields=['amount_achieved'],
+    )
+
+
+def records_changed(habit_ids, user_ids):
+    # Set-wise replacement for the per-row DailyRecord signal handlers after
+    # writes that bypass them.
+    for start in range(0, len(habit_ids), UPSERT_BATCH_SIZE):
+        batch = habit_ids[start:start + UPSERT_BATCH_SIZE]
+        refresh_success(batch)
+        rebuild_stats(batch)
+    bump_versions('habit', habit_ids)
+    bump_versions('user', user_ids)
+
+
+def log_record(habit_id, user_id, day, amount, increment=False):
+    # One INSERT ... SELECT ... ON CONFLICT DO UPDATE RETURNING: the habit's
+    # ownership check, the insert-or-update and the read of the new value
+    # happen in a single statement, so concurrent writers to the same day
+    # serialise on the row instead of racing to an IntegrityError. Returns
+    # None when the habit does not exist or belongs to someone else and
+    # raises CompactedHistory for days that were already compacted.
+    records = DailyRecord._meta.db_table
+    habits = Habit._meta.db_table
+    rollups = DailyRecordRollup._meta.db_table
+    if increment:
+        # Never below zero, for negative increments.
+        new_amount = (
+            f'CASE WHEN {records}.amount_achieved + %s < 0 THEN 0 '
+            f'ELSE {records}.amount_achieved + %s END'
+        )
+        params = [day, max(amount, 0), habit_id, user_id, habit_id, day, amount, amount]
+    else:
+        new_amount = 'EXCLUDED.amount_achieved'
+        params = [day, amount, habit_id, user_id, habit_id, day]
+
+    using = router.db_for_write(DailyRecord)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # Writers of the same habit take turns on its stats row (as in
+        # record_added), so the amount read here is still the old one when
+        # the upsert replaces it and the row can be updated incrementally.
+        stats = (
+            HabitStats.objects.using(using).select_for_update(of=('self',))
+            .select_related('habit').filter(habit_id=habit_id, habit__user_id=user_id).first()
+        )
+        if stats is None:
+            return None
+        old = DailyRecord.objects.using(using).filter(habit_id=habit_id, date=day).values_list('amount_achieved', flat=True).first()
+        cursor.execute(
+            f'INSERT INTO {records} (habit_id, date, amount_achieved) '
+            f'SELECT id, %s, %s FROM {habits} WHERE id = %s AND user_id = %s '
+            f'AND NOT EXISTS (SELECT 1 FROM {rollups} WHERE habit_id = %s AND period_end >= %s) '
+            f'ON CONFLICT (habit_id, date) DO UPDATE SET amount_achieved = {new_amount} '
+            f'RETURNING id, amount_achieved',
+            params,
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise CompactedHistory(habit_id, compacted_until([habit_id])[habit_id])
+        record_id, amount = row
+
+        habit = stats.habit
+        if fold_record(stats, habit.target, day, old, amount):
+            stats.save(update_fields=STATS_FIELDS)
+        else:
+            stats = rebuild_stats([habit_id])[habit_id]
+        if habit.success != stats.success:
+            Habit.objects.using(using).filter(pk=habit_id).update(success=stats.success)
+        bump_versions('habit', [habit_id])
+        bump_versions('user', [user_id])
+
+    return {
+        'id': record_id,
+        'habit': habit_id,
+        'date': day,
+        'amount_achieved': amount,
+        'success': stats.success,
+    }
@@ -1,21 +1,89 @@
+from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import DailyRecord
+from rest_framework.authtoken.models import Token
+from .models import Habit, DailyRecord, HabitStats
+from .stats import record_added, rebuild_stats
+from .services import has_hits, refresh_success
+from .rollups import retarget_rollups
+from .cache import bump_versions
+from .authentication import forget_tokens
+
+def deleted_with_habit(origin):
+    # Records removed by a cascade from their habit (or its user) need no
+    # bookkeeping: the habit and its stats row are going away too.
+    if origin is None:
+        return False
+    return getattr(origin, 'model', type(origin)) is not DailyRecord
 
 @receiver(post_save, sender=DailyRecord)
 def update_habit_success_on_save(sender, instance, created, **kwargs):
     habit = instance.habit
-    has_success = habit.daily_records.filter(amount_achieved__gte=habit.target).exists()
-    
+    has_success = has_hits(habit)
+
     if habit.success != has_success:
         habit.success = has_success
         habit.save(update_fields=['success'])
 
 @receiver(post_delete, sender=DailyRecord)
-def update_habit_success_on_delete(sender, instance, **kwargs):
+def update_habit_success_on_delete(sender, instance, origin=None, **kwargs):
+    if deleted_with_habit(origin):
+        return
     habit = instance.habit
-    has_success = habit.daily_records.filter(amount_achieved__gte=habit.target).exists()
-    
+    has_success = has_hits(habit)
+
     if habit.success != has_success:
         habit.success = has_success
-        habit.save(update_fields=['success'])
\ No newline at end of file
+        habit.save(update_fields=['success'])
+
+@receiver(post_save, sender=Habit)
+def create_habit_stats(sender, instance, created, **kwargs):
+    if created:
+        HabitStats.objects.get_or_create(habit=instance)
+
+@receiver(post_save, sender=Habit)
+def update_habit_on_target_change(sender, instance, created, **kwargs):
+    if created or not instance.target_changed():
+        return
+    retarget_rollups(instance.pk, instance.target)
+    refresh_success([instance.pk])
+    instance.refresh_from_db(fields=['success'])
+    instance.stats = rebuild_stats([instance.pk])[instance.pk]
+
+@receiver(post_save, sender=DailyRecord)
+def update_habit_stats_on_save(sender, instance, created, **kwargs):
+    if created:
+        record_added(instance)
+    else:
+        rebuild_stats([instance.habit_id])
+
+@receiver(post_delete, sender=DailyRecord)
+def update_habit_stats_on_delete(sender, instance, origin=None, **kwargs):
+    if not deleted_with_habit(origin):
+        rebuild_stats([instance.habit_id])
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def bump_versions_on_habit_change(sender, instance, **kwargs):
+    bump_versions('habit', [instance.pk])
+    bump_versions('user', [instance.user_id])
+
+@receiver(post_save, sender=DailyRecord)
+@receiver(post_delete, sender=DailyRecord)
+def bump_versions_on_record_change(sender, instance, origin=None, **kwargs):
+    if deleted_with_habit(origin):
+        return
+    bump_versions('habit', [instance.habit_id])
+    bump_versions('user', [instance.habit.user_id])
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+@receiver(post_save, sender=get_user_model())
+def forget_tokens_on_user_change(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login; anything else (deactivation,
+    # password or username changes) must not be served from the cache.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    forget_tokens(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
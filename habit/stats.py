@@ -0,0 +1,232 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.utils import timezone
+
+from .cache import get_version
+from .replicas import version_settled
+from .models import Habit, DailyRecord, DailyRecordRollup, HabitStats
+
+STATS_FIELDS = [
+    'count',
+    'total',
+    'best',
+    'average',
+    'success',
+    'current_streak',
+    'longest_streak',
+    'last_hit',
+    'hits',
+]
+
+
+def fold_runs(segments):
+    # segments are (first_hit, last_hit, first_run, last_run, longest_run)
+    # tuples in date order, either a single on-target day (day, day, 1, 1, 1)
+    # or a DailyRecordRollup. Returns the same tuple for their union.
+    first = previous = None
+    first_run = current = longest = 0
+    opening = True
+    for start, end, start_run, end_run, longest_run in segments:
+        if previous is not None and start - previous == timedelta(days=1):
+            current += start_run
+        else:
+            opening = opening and previous is None
+            current = start_run
+        longest = max(longest, current, longest_run)
+        if opening:
+            first_run = current
+        # A segment whose first run stops short of its last hit breaks the run.
+        if end - start != timedelta(days=start_run - 1):
+            opening = False
+            current = end_run
+        if first is None:
+            first = start
+        previous = end
+    return first, previous, first_run, current, longest
+
+
+def compute_streaks(hit_dates):
+    # hit_dates must be sorted ascending and unique. The current streak is the
+    # run of consecutive on-target days that ends at the last hit.
+    _, last_hit, _, current, longest = fold_runs((day, day, 1, 1, 1) for day in hit_dates)
+    return current, longest, last_hit
+
+
+def compute_stats(habit_ids):
+    # Raw records and compacted rollups are read together: one UNION for the
+    # aggregates and one for the on-target segments.
+    habit_ids = list(habit_ids)
+    stats = {habit_id: HabitStats(habit_id=habit_id) for habit_id in habit_ids}
+
+    raw = (
+        DailyRecord.objects.filter(habit_id__in=habit_ids)
+        .values('habit_id')
+        .annotate(
+            count=Count('id'),
+            total=Sum('amount_achieved'),
+            best=Max('amount_achieved'),
+        )
+        .order_by()
+    )
+    rolled = (
+        DailyRecordRollup.objects.filter(habit_id__in=habit_ids)
+        .values('habit_id')
+        .annotate(
+            count=Sum('count'),
+            total=Sum('total'),
+            best=Max('best'),
+        )
+        .order_by()
+    )
+    for row in raw.union(rolled, all=True):
+        item = stats[row['habit_id']]
+        item.count += row['count']
+        item.total = (item.total or 0) + row['total']
+        item.best = row['best'] if item.best is None else max(item.best, row['best'])
+    for item in stats.values():
+        if item.count:
+            item.average = item.total / item.count
+
+    segments = defaultdict(list)
+    hits = (
+        DailyRecord.objects.filter(habit_id__in=habit_ids, amount_achieved__gte=F('habit__target'))
+        .annotate(last=F('date'), hits=Value(1), first_run=Value(1), last_run=Value(1), longest_run=Value(1))
+        .values_list('habit_id', 'date', 'last', 'hits', 'first_run', 'last_run', 'longest_run')
+    )
+    rolled_hits = (
+        DailyRecordRollup.objects.filter(habit_id__in=habit_ids, hits__gt=0)
+        .values_list('habit_id', 'first_hit', 'last_hit', 'hits', 'first_run', 'last_run', 'longest_run')
+    )
+    rows = hits.union(rolled_hits, all=True).order_by('habit_id', 'date')
+    for habit_id, first, last, count, first_run, last_run, longest_run in rows.iterator(chunk_size=5000):
+        segments[habit_id].append((first, last, first_run, last_run, longest_run))
+        stats[habit_id].hits += count
+    for habit_id, items in segments.items():
+        item = stats[habit_id]
+        item.success = True
+        _, item.last_hit, _, item.current_streak, item.longest_streak = fold_runs(items)
+
+    return stats
+
+
+def rebuild_stats(habit_ids):
+    stats = compute_stats(habit_ids)
+    HabitStats.objects.bulk_create(
+        stats.values(),
+        update_conflicts=True,
+        unique_fields=['habit'],
+        update_fields=STATS_FIELDS,
+    )
+    return stats
+
+
+def fold_record(stats, target, day, old, new):
+    # Folds one record whose amount went from old (None for a new record) to
+    # new into the stored row. Returns False when that cannot be done without
+    # rescanning the history: a hit before the last one, which can split or
+    # join streaks, a lost hit away from the end of the current streak, or a
+    # lowered best.
+    was_hit = old is not None and old >= target
+    is_hit = new >= target
+
+    if is_hit and not was_hit:
+        if stats.last_hit is not None and day < stats.last_hit:
+            return False
+        if stats.last_hit is not None and day - stats.last_hit == timedelta(days=1):
+            stats.current_streak += 1
+        else:
+            stats.current_streak = 1
+        stats.longest_streak = max(stats.longest_streak, stats.current_streak)
+        stats.last_hit = day
+        stats.success = True
+        stats.hits += 1
+    elif was_hit and not is_hit:
+        if stats.hits == 1:
+            stats.current_streak = stats.longest_streak = stats.hits = 0
+            stats.last_hit = None
+            stats.success = False
+        elif day == stats.last_hit and 1 < stats.current_streak < stats.longest_streak:
+            stats.current_streak -= 1
+            stats.last_hit -= timedelta(days=1)
+            stats.hits -= 1
+        else:
+            return False
+
+    if old is None:
+        stats.count += 1
+        stats.total = (stats.total or 0) + new
+    else:
+        if old == stats.best and new < old:
+            return False
+        stats.total += new - old
+    stats.best = new if stats.best is None else max(stats.best, new)
+    stats.average = stats.total / stats.count
+    return True
+
+
+def record_added(record):
+    # Appending a record is the hot path, so fold it into the stored row
+    # instead of rescanning the habit's history.
+    habit = record.habit
+    stats, _ = HabitStats.objects.select_for_update().get_or_create(habit_id=habit.pk)
+    if fold_record(stats, habit.target, record.date, None, record.amount_achieved):
+        stats.save(update_fields=STATS_FIELDS)
+    else:
+        rebuild_stats([habit.pk])
+
+
+def iter_habit_ids(batch_size):
+    last_id = 0
+    while True:
+        ids = list(
+            Habit.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def _last_days(today, days):
+    return Q(date__gt=today - timedelta(days=days), date__lte=today)
+
+
+def compute_analytics(habit, today=None):
+    today = today or timezone.localdate()
+    version = get_version('habit', habit.pk)
+    key = f'habit:analytics:{habit.pk}:{version}:{today.isoformat()}'
+    analytics = cache.get(key)
+    if analytics is not None:
+        return analytics
+
+    # Only the last 30 days are read from the records; counts and streaks
+    # come from the maintained stats row, which also covers compacted history.
+    totals = habit.daily_records.filter(_last_days(today, 30)).aggregate(
+        sum_7d=Sum('amount_achieved', filter=_last_days(today, 7), default=0),
+        sum_30d=Sum('amount_achieved', default=0),
+    )
+    stats = getattr(habit, 'stats', None) or HabitStats(habit=habit)
+
+    current_streak = stats.current_streak
+    if stats.last_hit is None or stats.last_hit < today - timedelta(days=1):
+        current_streak = 0
+
+    analytics = {
+        'habit': habit.pk,
+        'date': today,
+        'current_streak': current_streak,
+        'longest_streak': stats.longest_streak,
+        'average_7d': totals['sum_7d'] / 7,
+        'average_30d': totals['sum_30d'] / 30,
+        'completion_rate': stats.hits / stats.count if stats.count else None,
+    }
+    # Built from a replica that may lag: not kept under the newer version.
+    if version_settled(version):
+        cache.set(key, analytics, settings.HABIT_ANALYTICS_CACHE_TIMEOUT)
+    return analytics
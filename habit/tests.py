@@ -1,11 +1,47 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+import time
+import msgpack
+from decimal import Decimal
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.models import Prefetch
+from unittest import mock, skipUnless
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils.translation import gettext_lazy
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.versioning import AcceptHeaderVersioning
 from datetime import date, timedelta
-from .models import Habit, DailyRecord
+from .authentication import TOKEN_CACHE_ALIAS, token_cache_keys
+from .cache import get_version, new_version, version_key
+from .middleware import ReplicaRoutingMiddleware
+from .models import Habit, DailyRecord, DailyRecordRollup, DueHabit, HabitStats
+from .replicas import copy_primary, pin_primary, read_alias, wrote_recently
 from .serializers import HabitSerializer, DailyRecordSerializer
+from .urls import async_read_urlpatterns
+from .views import HabitViewSet
+from .renderers import ORJSONRenderer
+from . import partitions
+from .importing import ForeignHabits, ImportFailed, copy_import
+from .rollups import compact_records, period_bounds
+from .services import log_record, refresh_success
+from .stats import STATS_FIELDS, compute_analytics, compute_stats, rebuild_stats
 
 User = get_user_model()
 
@@ -92,8 +128,8 @@ class ViewTests(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(self.habits_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Reading')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Reading')
 
     def test_create_habit(self):
         self.client.force_authenticate(user=self.user)
@@ -133,7 +169,7 @@ class ViewTests(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(self.records_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_create_daily_record(self):
         self.client.force_authenticate(user=self.user)
@@ -333,4 +369,1811 @@ class IntegrationTests(APITestCase):
             format = 'json'
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['amount_achieved'], 2)
\ No newline at end of file
+        self.assertEqual(response.data['amount_achieved'], 2)
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habits = [
+            Habit.objects.create(
+                user=self.user,
+                name=f'Habit {i}',
+                description='Test',
+                target=5,
+                unit='times'
+            )
+            for i in range(2)
+        ]
+        for day in range(3):
+            for habit in self.habits:
+                DailyRecord.objects.create(
+                    habit=habit,
+                    date=date(2024, 1, 3) - timedelta(days=day),
+                    amount_achieved=day
+                )
+
+    def collect(self, url):
+        results = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results.extend(response.data['results'])
+            url = response.data['next']
+        return results
+
+    def test_daily_records_keyset_order(self):
+        results = self.collect(reverse('dailyrecord-list') + '?page_size=4')
+        keys = [(record['date'], record['id']) for record in results]
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(keys, sorted(keys))
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get(reverse('dailyrecord-list') + '?page_size=2')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_page_size_is_capped(self):
+        with self.settings(HABIT_MAX_PAGE_SIZE=1):
+            response = self.client.get(reverse('habit-list') + '?page_size=50')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('habit-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecordsWindowTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='times'
+        )
+        self.today = date.today()
+        for day in range(40):
+            DailyRecord.objects.create(
+                habit=self.habit,
+                date=self.today - timedelta(days=day),
+                amount_achieved=day
+            )
+        self.url = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+
+    def test_default_window_is_last_30_days(self):
+        response = self.client.get(self.url)
+        records = response.data['daily_records']
+        self.assertEqual(len(records), 30)
+        self.assertEqual(records[0]['date'], self.today - timedelta(days=29))
+        self.assertEqual(records[-1]['date'], self.today)
+        self.assertEqual(response.data['total'], sum(range(40)))
+
+    def test_limit_keeps_newest_records(self):
+        response = self.client.get(self.url, {'records_limit': 3})
+        dates = [record['date'] for record in response.data['daily_records']]
+        self.assertEqual(dates, [self.today - timedelta(days=day) for day in (2, 1, 0)])
+
+    def test_explicit_range(self):
+        response = self.client.get(self.url, {
+            'records_from': (self.today - timedelta(days=39)).isoformat(),
+            'records_to': (self.today - timedelta(days=35)).isoformat(),
+        })
+        self.assertEqual(len(response.data['daily_records']), 5)
+
+    def test_invalid_range(self):
+        response = self.client.get(self.url, {
+            'records_from': self.today.isoformat(),
+            'records_to': (self.today - timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='times'
+        )
+        DailyRecord.objects.create(habit=self.habit, date=date.today(), amount_achieved=6)
+        self.url = reverse('habit-list')
+
+    def test_plain_list_is_one_narrow_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'id,name,success'})
+        self.assertEqual(response.data['results'], [{'id': self.habit.pk, 'name': 'Reading', 'success': True}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertNotIn('description', queries[0]['sql'])
+
+    def test_expand(self):
+        response = self.client.get(self.url, {'expand': 'stats'})
+        habit = response.data['results'][0]
+        self.assertNotIn('daily_records', habit)
+        self.assertEqual((habit['user'], habit['total'], habit['best']), ('testuser', 6, 6))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'fields': 'id', 'expand': 'daily_records'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'daily_records'})
+
+    def test_retrieve_with_fields(self):
+        url = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'fields': 'id,target', 'expand': ''})
+        self.assertEqual(response.data, {'id': self.habit.pk, 'target': 5})
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'expand': 'user'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValuesSerializerTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='tëstuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habits = [
+            Habit.objects.create(
+                user=self.user,
+                name='Чтение "1"',
+                description='Line\nbreak',
+                target=3,
+                unit='pages'
+            ),
+            Habit.objects.create(
+                user=self.user,
+                name='Empty',
+                description='',
+                target=1,
+                unit='times'
+            ),
+        ]
+        for day, amount in enumerate((1, 0, 4)):
+            DailyRecord.objects.create(
+                habit=self.habits[0],
+                date=date.today() - timedelta(days=day),
+                amount_achieved=amount
+            )
+
+    def expected(self, serializer):
+        return JSONRenderer().render({'next': None, 'previous': None, 'results': serializer.data})
+
+    def test_habit_list_matches_serializer(self):
+        habits = Habit.objects.filter(user=self.user).select_related('stats', 'user').prefetch_related(
+            Prefetch('daily_records', queryset=DailyRecord.objects.order_by('date'), to_attr='prefetched_daily_records')
+        ).order_by('id')
+        response = self.client.get(reverse('habit-list'))
+        self.assertEqual(response.content, self.expected(HabitSerializer(habits, many=True)))
+
+        fields = {'id', 'user', 'average', 'success'}
+        response = self.client.get(reverse('habit-list'), {'fields': ','.join(fields)})
+        self.assertEqual(response.content, self.expected(HabitSerializer(habits, many=True, fields=fields)))
+
+    def test_daily_record_list_matches_serializer(self):
+        records = DailyRecord.objects.select_related('habit').order_by('date', 'id')
+        response = self.client.get(reverse('dailyrecord-list'))
+        self.assertEqual(response.content, self.expected(DailyRecordSerializer(records, many=True)))
+
+
+class RendererTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 1), amount_achieved=6)
+
+    def test_orjson_matches_json_renderer(self):
+        data = {
+            'detail': gettext_lazy('Not found.'),
+            'date': date(2024, 1, 1),
+            'amount': Decimal('1.50'),
+            'average': 5 / 3,
+            'name': 'Чтение',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = ORJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_orjson_matches_json_renderer_on_edge_cases(self):
+        for data in [
+            {'name': 'line\u2028separator\u2029', 'dash': '\u2014'},
+            {1: 'int', 2.5: 'float', None: 'none', False: 'bool'},
+            {'big': 2 ** 70, 'small': -2 ** 64, 'max': 2 ** 64 - 1},
+            ['\u2028', [2 ** 100]],
+        ]:
+            with self.subTest(data=data):
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # Floats with exponents keep their value but not JSONRenderer's spelling.
+        data = {'a': 1e16, 'b': 1e-7, 'c': 2.5e-5, 'average': 0.1 + 0.2}
+        self.assertEqual(JSONRenderer().render(data), b'{"a":1e+16,"b":1e-07,"c":2.5e-05,"average":0.30000000000000004}')
+        self.assertEqual(ORJSONRenderer().render(data), b'{"a":1e16,"b":1e-7,"c":0.000025,"average":0.30000000000000004}')
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), data)
+        # Where JSONRenderer refuses, null is rendered instead.
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'average': float('nan')})
+        self.assertEqual(ORJSONRenderer().render({'average': float('nan')}), b'{"average":null}')
+
+    def test_msgpack_negotiation(self):
+        url = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+        json_response = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(json_response.content))
+        self.assertLess(len(response.content), len(json_response.content))
+
+    def test_msgpack_request(self):
+        payload = {'habit': self.habit.pk, 'date': '2024-01-02', 'amount_achieved': 3}
+        response = self.client.post(
+            reverse('dailyrecord-list'),
+            msgpack.packb(payload),
+            content_type='application/msgpack'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['amount_achieved'], 3)
+
+    def test_malformed_bodies(self):
+        url = reverse('dailyrecord-list')
+        response = self.client.post(url, b'{"habit":', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryCountTests(APITestCase):
+    # Query counts per endpoint must not grow with the number of rows.
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        today = date.today()
+        self.habits = []
+        for i in range(5):
+            habit = Habit.objects.create(
+                user=self.user,
+                name=f'Habit {i}',
+                description='Test',
+                target=5,
+                unit='times'
+            )
+            DailyRecord.objects.bulk_create([
+                DailyRecord(habit=habit, date=today - timedelta(days=day), amount_achieved=day)
+                for day in range(10)
+            ])
+            self.habits.append(habit)
+        call_command('habit_stats', stdout=StringIO())
+
+    def assertQueries(self, count, url, params=None):
+        with self.assertNumQueries(count):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_habit_endpoints(self):
+        self.assertQueries(2, reverse('habit-list'))
+        self.assertQueries(1, reverse('habit-list'), {'fields': 'id,name'})
+        self.assertQueries(2, reverse('habit-detail', kwargs={'pk': self.habits[0].pk}))
+        self.assertQueries(2, reverse('habit-analytics', kwargs={'pk': self.habits[0].pk}))
+
+    def test_daily_record_endpoints(self):
+        response = self.assertQueries(1, reverse('dailyrecord-list'))
+        self.assertEqual(len(response.data['results']), 50)
+        record = DailyRecord.objects.filter(habit=self.habits[0]).first()
+        self.assertQueries(1, reverse('dailyrecord-detail', kwargs={'pk': record.pk}))
+
+    def test_export(self):
+        response = self.client.get(reverse('habit-export'))
+        with self.assertNumQueries(1):
+            b''.join(response.streaming_content)
+
+    def add_habits(self, count):
+        today = date.today()
+        for i in range(count):
+            habit = Habit.objects.create(user=self.user, name=f'More {i}', description='Test', target=5, unit='times')
+            DailyRecord.objects.bulk_create([
+                DailyRecord(habit=habit, date=today - timedelta(days=day), amount_achieved=day)
+                for day in range(20)
+            ])
+        call_command('recompute_success', stdout=StringIO())
+
+    def count_queries(self, day):
+        habit = self.habits[0]
+        record = DailyRecord.objects.filter(habit=habit).first()
+        counts = {}
+        for name, url, params in [
+            ('habit-list', reverse('habit-list'), {}),
+            ('habit-list-fields', reverse('habit-list'), {'fields': 'id,user,success'}),
+            ('habit-detail', reverse('habit-detail', kwargs={'pk': habit.pk}), {}),
+            ('habit-detail-fields', reverse('habit-detail', kwargs={'pk': habit.pk}), {'fields': 'id,user'}),
+            ('habit-analytics', reverse('habit-analytics', kwargs={'pk': habit.pk}), {}),
+            ('habit-series', reverse('habit-series', kwargs={'pk': habit.pk}), {}),
+            ('habit-series-list', reverse('habit-series-list'), {}),
+            ('dailyrecord-list', reverse('dailyrecord-list'), {}),
+            ('dailyrecord-detail', reverse('dailyrecord-detail', kwargs={'pk': record.pk}), {}),
+        ]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, name)
+            counts[name] = len(queries)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('dailyrecord-list'), {
+                'habit': habit.pk, 'date': day, 'amount_achieved': 1,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        counts['dailyrecord-create'] = len(queries)
+        return counts
+
+    def test_counts_do_not_grow_with_data(self):
+        call_command('recompute_success', stdout=StringIO())
+        cache.clear()
+        small = self.count_queries('2000-01-01')
+        self.add_habits(10)
+        cache.clear()
+        self.assertEqual(self.count_queries('2000-01-02'), small)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN checks target the Postgres indexes')
+class QueryPlanTests(TestCase):
+    # Seeded tables are small, so sequential scans are priced out: a plan
+    # that still uses one has no usable index.
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'user{i}', password='x') for i in range(20)]
+        habits = Habit.objects.bulk_create([
+            Habit(user=user, name=f'Habit {i}', description='Test', target=5, unit='times')
+            for user in cls.users
+            for i in range(5)
+        ])
+        start = date(2024, 1, 1)
+        DailyRecord.objects.bulk_create([
+            DailyRecord(habit=habit, date=start + timedelta(days=day), amount_achieved=day % 10)
+            for habit in habits
+            for day in range(60)
+        ])
+        cls.habit = habits[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE habit_habit')
+            cursor.execute('ANALYZE habit_dailyrecord')
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertIndexed(self, queryset, index=None):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan)
+        if index is not None:
+            self.assertIn(index, plan)
+
+    def test_habits_by_user(self):
+        self.assertIndexed(Habit.objects.filter(user=self.users[3]).order_by('id'), 'habit_user_id_idx')
+
+    def test_daily_records_by_user(self):
+        records = DailyRecord.objects.filter(habit__user=self.users[3]).order_by('date', 'id')
+        self.assertIndexed(records, 'habit_user_id_idx')
+
+    def test_success_check(self):
+        hits = DailyRecord.objects.filter(habit=self.habit, amount_achieved__gte=5)
+        self.assertIndexed(hits.values_list('habit_id')[:1])
+
+    def test_records_window(self):
+        records = DailyRecord.objects.filter(habit=self.habit, date__gte=date(2024, 2, 1)).order_by('-date')
+        self.assertIndexed(records.values_list('date', 'amount_achieved'), 'dailyrecord_habit_date_cover')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning needs PostgreSQL')
+class PartitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        self.records = [
+            DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 15), amount_achieved=6),
+            DailyRecord.objects.create(habit=self.habit, date=date(2024, 3, 2), amount_achieved=2),
+        ]
+        with connection.cursor() as cursor:
+            # Pending deferred FK checks would block the ALTER TABLEs below.
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            if partitions.is_partitioned(cursor):
+                partitions.unpartition(cursor)
+            partitions.convert(cursor, 'month', today=date(2024, 3, 10), ahead=1)
+
+    def partition_names(self):
+        with connection.cursor() as cursor:
+            return [name for name, _, _ in partitions.list_partitions(cursor)]
+
+    def test_convert(self):
+        self.assertEqual(self.partition_names(), [
+            'habit_dailyrecord_default',
+            'habit_dailyrecord_y2024m01',
+            'habit_dailyrecord_y2024m02',
+            'habit_dailyrecord_y2024m03',
+            'habit_dailyrecord_y2024m04',
+        ])
+        self.assertEqual(
+            list(DailyRecord.objects.order_by('date').values_list('id', flat=True)),
+            [record.pk for record in self.records]
+        )
+        record = DailyRecord.objects.create(habit=self.habit, date=date(2024, 2, 1), amount_achieved=1)
+        self.assertGreater(record.pk, self.records[1].pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 15), amount_achieved=1)
+
+    def test_ensure_partitions_moves_default_rows(self):
+        DailyRecord.objects.create(habit=self.habit, date=date(2025, 6, 1), amount_achieved=1)
+        with connection.cursor() as cursor:
+            created = partitions.ensure_partitions(cursor, today=date(2024, 4, 20), ahead=1)
+            cursor.execute('SELECT count(*) FROM habit_dailyrecord_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(created, ['habit_dailyrecord_y2024m05', 'habit_dailyrecord_y2025m06'])
+        self.assertEqual(DailyRecord.objects.count(), 3)
+
+    def test_partition_pruning(self):
+        records = DailyRecord.objects.filter(habit=self.habit, date__gte=date(2024, 3, 1), date__lt=date(2024, 4, 1))
+        plan = records.explain()
+        self.assertIn('habit_dailyrecord_y2024m03', plan)
+        self.assertNotIn('habit_dailyrecord_y2024m01', plan)
+
+    def test_drop_old_partitions(self):
+        with connection.cursor() as cursor:
+            removed = partitions.remove_partitions(cursor, date(2024, 2, 1), drop=True)
+        self.assertEqual(removed, ['habit_dailyrecord_y2024m01'])
+        self.assertEqual(DailyRecord.objects.get().date, date(2024, 3, 2))
+        self.habit.refresh_from_db()
+        self.assertFalse(self.habit.success)
+        self.assertEqual(HabitStats.objects.get(habit=self.habit).total, 2)
+
+    def test_unpartition(self):
+        with connection.cursor() as cursor:
+            partitions.unpartition(cursor)
+            self.assertFalse(partitions.is_partitioned(cursor))
+        self.assertEqual(DailyRecord.objects.count(), 2)
+        record = DailyRecord.objects.create(habit=self.habit, date=date(2024, 2, 1), amount_achieved=1)
+        self.assertGreater(record.pk, self.records[1].pk)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('habit_partitions', '--detach-before', '2024-02-01', stdout=out)
+        self.assertIn('Detached habit_dailyrecord_y2024m01', out.getvalue())
+        self.assertNotIn('habit_dailyrecord_y2024m01', self.partition_names())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM habit_dailyrecord_y2024m01_detached')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('habit-detail', kwargs={'pk': self.habit.pk}))
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('habit-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('habit_request_duration_seconds_count{method="GET",status="200",view="habit-list"}', body)
+        self.assertIn('habit_request_db_queries_bucket{le="2.0",view="habit-list"}', body)
+        self.assertIn('habit_request_serialize_duration_seconds_count{view="habit-list"}', body)
+
+    @override_settings(HABIT_METRICS_TOKEN='secret')
+    def test_metrics_require_allowed_address_or_token(self):
+        url = reverse('metrics')
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with override_settings(HABIT_METRICS_TOKEN=''):
+            response = self.client.get(url, REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(HABIT_SLOW_REQUEST_MS=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('habit.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('habit-list'), {'fields': 'id'})
+        self.assertIn('GET /habits/?fields=id (habit-list)', logs.output[0])
+        self.assertIn('SELECT "habit_habit"."id"', logs.output[0])
+
+
+class HabitStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Running',
+            description='Test',
+            target=5,
+            unit='km'
+        )
+
+    def add(self, day, amount):
+        return DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, day), amount_achieved=amount)
+
+    def stats(self):
+        return HabitStats.objects.get(habit=self.habit)
+
+    def test_stats_follow_inserts(self):
+        for day, amount in [(1, 5), (2, 6), (3, 1), (4, 7), (5, 8)]:
+            self.add(day, amount)
+        stats = self.stats()
+        self.assertEqual((stats.count, stats.total, stats.best), (5, 27, 8))
+        self.assertEqual(stats.average, 27 / 5)
+        self.assertTrue(stats.success)
+        self.assertEqual((stats.current_streak, stats.longest_streak), (2, 2))
+        self.assertEqual(stats.last_hit, date(2024, 1, 5))
+
+    def test_backfilled_hit_joins_streaks(self):
+        self.add(1, 5)
+        self.add(3, 5)
+        self.add(2, 5)
+        stats = self.stats()
+        self.assertEqual((stats.current_streak, stats.longest_streak), (3, 3))
+
+    def test_stats_follow_updates_and_deletes(self):
+        first = self.add(1, 9)
+        self.add(2, 2)
+        first.amount_achieved = 1
+        first.save()
+        stats = self.stats()
+        self.assertEqual((stats.total, stats.best, stats.success), (3, 2, False))
+
+        first.delete()
+        stats = self.stats()
+        self.assertEqual((stats.count, stats.total, stats.longest_streak), (1, 2, 0))
+
+    def test_habit_without_records(self):
+        stats = self.stats()
+        self.assertEqual(stats.count, 0)
+        self.assertIsNone(stats.total)
+        self.assertIsNone(stats.average)
+
+    def test_target_change_rebuilds_stats(self):
+        self.add(1, 3)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.patch(reverse('habit-detail', kwargs={'pk': self.habit.pk}), {'target': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.stats().success)
+
+    def test_command_verifies_and_rebuilds(self):
+        self.add(1, 5)
+        HabitStats.objects.filter(habit=self.habit).update(count=0, total=None)
+        with self.assertRaises(CommandError):
+            call_command('habit_stats', '--verify', stdout=StringIO(), stderr=StringIO())
+        call_command('habit_stats', stdout=StringIO())
+        call_command('habit_stats', '--verify', stdout=StringIO())
+        self.assertEqual(self.stats().total, 5)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Running',
+            description='Test',
+            target=5,
+            unit='km'
+        )
+        # Hit runs cross week and month boundaries and reach the raw records.
+        start = date(2024, 1, 1)
+        DailyRecord.objects.bulk_create([
+            DailyRecord(habit=self.habit, date=start + timedelta(days=day), amount_achieved=(day * 7) % 11)
+            for day in range(120)
+            if day % 13 != 5
+        ])
+        rebuild_stats([self.habit.pk])
+
+    def snapshot(self):
+        stats = compute_stats([self.habit.pk])[self.habit.pk]
+        return {field: getattr(stats, field) for field in STATS_FIELDS}
+
+    def test_compaction_keeps_statistics(self):
+        expected = self.snapshot()
+        for period in ('month', 'week'):
+            with self.subTest(period=period):
+                list(compact_records(date(2024, 3, 15), period))
+                self.assertEqual(self.snapshot(), expected)
+                self.assertFalse(DailyRecord.objects.filter(date__lt=period_bounds(date(2024, 3, 15), period)[0]).exists())
+        self.assertEqual(self.habit.rollups.filter(period_start=date(2024, 1, 1)).get().period_end, date(2024, 1, 31))
+        self.assertEqual(sum(self.habit.rollups.values_list('count', flat=True)), expected['count'] - DailyRecord.objects.count())
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual({field: getattr(stats, field) for field in STATS_FIELDS}, expected)
+
+    def test_records_written_after_compaction(self):
+        list(compact_records(date(2024, 3, 1), 'month'))
+        # A day without a record before compaction.
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 6), amount_achieved=1)
+        expected = self.snapshot()
+        self.assertEqual(expected, {field: getattr(HabitStats.objects.get(habit=self.habit), field) for field in STATS_FIELDS})
+        list(compact_records(date(2024, 3, 1), 'month'))
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(self.habit.rollups.count(), 2)
+
+    def test_success_from_rollups(self):
+        list(compact_records(date(2024, 4, 1), 'month'))
+        DailyRecord.objects.filter(amount_achieved__gte=5).delete()
+        self.habit.refresh_from_db()
+        self.assertTrue(self.habit.success)
+        Habit.objects.update(success=False)
+        refresh_success([self.habit.pk])
+        self.habit.refresh_from_db()
+        self.assertTrue(self.habit.success)
+        self.habit.target = 11
+        self.habit.save()
+        self.habit.refresh_from_db()
+        self.assertFalse(self.habit.success)
+
+    def test_target_change_reevaluates_rollups(self):
+        habit = Habit.objects.create(user=self.user, name='Reading', description='Test', target=5, unit='pages')
+        for day, amount in ((1, 6), (2, 6), (3, 2)):
+            DailyRecord.objects.create(habit=habit, date=date(2023, 1, day), amount_achieved=amount)
+        list(compact_records(date(2023, 2, 1), 'month'))
+
+        def state():
+            habit.refresh_from_db()
+            stats = HabitStats.objects.get(habit=habit)
+            return habit.success, stats.success, stats.hits, stats.current_streak
+
+        self.assertEqual(state(), (True, True, 2, 2))
+        habit.target = 10
+        habit.save()
+        self.assertEqual(state(), (False, False, 0, 0))
+        habit.target = 2
+        habit.save()
+        self.assertEqual(state(), (True, True, 3, 3))
+        self.assertEqual(compute_stats([habit.pk])[habit.pk].hits, 3)
+
+    def test_rejects_writes_into_compacted_history(self):
+        list(compact_records(date(2024, 3, 1), 'month'))
+        expected = self.snapshot()
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        record = DailyRecord.objects.get(date=date(2024, 3, 5))
+        responses = [
+            client.post(reverse('dailyrecord-list'), {'habit': self.habit.pk, 'date': '2024-02-29', 'amount_achieved': 1}, format='json'),
+            client.patch(reverse('dailyrecord-detail', kwargs={'pk': record.pk}), {'date': '2024-01-06'}, format='json'),
+            client.put(reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': '2024-01-06'}), {'amount_achieved': 9}, format='json'),
+            client.post(reverse('habit-record-increment', kwargs={'pk': self.habit.pk, 'day': '2024-02-29'}), {}, format='json'),
+            client.post(reverse('dailyrecord-bulk'), [
+                {'habit': self.habit.pk, 'date': '2024-03-02', 'amount_achieved': 1},
+                {'habit': self.habit.pk, 'date': '2024-02-01', 'amount_achieved': 1},
+            ], format='json'),
+            client.post(reverse('dailyrecord-import'), {'file': SimpleUploadedFile(
+                'records.csv', f'habit,date,amount_achieved\n{self.habit.pk},2024-01-06,9\n'.encode()
+            )}, format='multipart'),
+        ]
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DailyRecord.objects.filter(date__lt=date(2024, 3, 1)).exists())
+        self.assertEqual(DailyRecord.objects.get(date=date(2024, 3, 2)).amount_achieved, (61 * 7) % 11)
+        self.assertEqual(self.snapshot(), expected)
+        # Later days and other users' requests behave as before.
+        response = client.put(reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': '2024-03-01'}), {'amount_achieved': 9}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        other = User.objects.create_user(username='other', password='testpass123')
+        client.force_authenticate(user=other)
+        response = client.put(reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': '2024-01-06'}), {'amount_achieved': 9}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_analytics_unchanged(self):
+        today = date(2024, 4, 29)
+        self.habit.refresh_from_db()
+        expected = compute_analytics(self.habit, today)
+        list(compact_records(date(2024, 3, 1), 'week'))
+        self.habit.refresh_from_db()
+        self.assertEqual(compute_analytics(self.habit, today), expected)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compact_records', '--horizon', '31', stdout=out)
+        self.assertEqual(DailyRecord.objects.count(), 0)
+        self.assertIn('into 4 rollups', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('compact_records', '--horizon', '7')
+
+
+class BulkRecordTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        self.url = reverse('dailyrecord-bulk')
+
+    def test_bulk_upsert(self):
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 1), amount_achieved=1)
+        payload = [
+            {'habit': self.habit.pk, 'date': f'2024-01-{day:02d}', 'amount_achieved': day}
+            for day in range(1, 8)
+        ]
+        with self.assertNumQueries(10):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['habits'], [{'id': self.habit.pk, 'success': True}])
+        self.assertEqual(DailyRecord.objects.count(), 7)
+        self.assertEqual(DailyRecord.objects.get(date=date(2024, 1, 1)).amount_achieved, 1)
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual((stats.count, stats.total, stats.longest_streak), (7, 28, 3))
+
+    def test_duplicate_rows_last_wins(self):
+        payload = [
+            {'habit': self.habit.pk, 'date': '2024-01-01', 'amount_achieved': 9},
+            {'habit': self.habit.pk, 'date': '2024-01-01', 'amount_achieved': 2},
+        ]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(DailyRecord.objects.get().amount_achieved, 2)
+        self.habit.refresh_from_db()
+        self.assertFalse(self.habit.success)
+
+    def test_rejects_foreign_habits(self):
+        other_habit = Habit.objects.create(
+            user=self.other_user,
+            name='Other',
+            description='Test',
+            target=1,
+            unit='times'
+        )
+        payload = [
+            {'habit': self.habit.pk, 'date': '2024-01-01', 'amount_achieved': 1},
+            {'habit': other_habit.pk, 'date': '2024-01-01', 'amount_achieved': 1},
+        ]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(DailyRecord.objects.exists())
+
+    def test_validation_errors(self):
+        response = self.client.post(self.url, [{'habit': self.habit.pk, 'date': '2024-01-01', 'amount_achieved': -1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecordUpsertTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Water',
+            description='Test',
+            target=8,
+            unit='glasses'
+        )
+        self.url = reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': '2024-01-02'})
+        self.increment_url = reverse('habit-record-increment', kwargs={'pk': self.habit.pk, 'day': '2024-01-02'})
+
+    def test_put_creates_then_replaces(self):
+        response = self.client.put(self.url, {'amount_achieved': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        record = DailyRecord.objects.get()
+        self.assertEqual(response.json(), {
+            'id': record.pk, 'habit': self.habit.pk, 'date': '2024-01-02', 'amount_achieved': 3, 'success': False,
+        })
+        response = self.client.put(self.url, {'amount_achieved': 9}, format='json')
+        self.assertEqual(response.data['id'], record.pk)
+        self.assertTrue(response.data['success'])
+        self.habit.refresh_from_db()
+        self.assertTrue(self.habit.success)
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual((stats.count, stats.total, stats.current_streak), (1, 9, 1))
+
+    def test_increment(self):
+        for amount, expected in [(None, 1), (4, 5), (3, 8), (-10, 0)]:
+            data = {} if amount is None else {'amount': amount}
+            response = self.client.post(self.increment_url, data, format='json')
+            self.assertEqual(response.data['amount_achieved'], expected)
+        self.assertEqual(DailyRecord.objects.get().amount_achieved, 0)
+        self.assertFalse(response.data['success'])
+        self.assertEqual(HabitStats.objects.get(habit=self.habit).best, 0)
+
+    def test_incremental_stats_match_rebuild(self):
+        # Appends, back-fills, lost hits at and away from the last hit, and a
+        # lowered best.
+        steps = [
+            (5, 8), (6, 9), (7, 8), (8, 8), (1, 8), (2, 8), (8, 3), (8, 9), (8, 1),
+            (6, 2), (3, 8), (8, 8), (8, 0), (9, 12), (9, 4), (9, 0), (2, 0), (1, 0), (3, 0), (5, 0), (7, 0),
+        ]
+        for day, amount in steps:
+            url = reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': f'2024-01-{day:02d}'})
+            response = self.client.put(url, {'amount_achieved': amount}, format='json')
+            stats = HabitStats.objects.get(habit=self.habit)
+            expected = compute_stats([self.habit.pk])[self.habit.pk]
+            self.assertEqual(
+                {field: getattr(stats, field) for field in STATS_FIELDS},
+                {field: getattr(expected, field) for field in STATS_FIELDS},
+                (day, amount),
+            )
+            self.assertEqual(response.data['success'], expected.success)
+        self.habit.refresh_from_db()
+        self.assertFalse(self.habit.success)
+
+    def test_append_does_not_rescan_history(self):
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 1), amount_achieved=8)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.put(self.url, {'amount_achieved': 8}, format='json')
+        self.assertEqual(HabitStats.objects.get(habit=self.habit).current_streak, 2)
+        self.assertFalse([query for query in queries if 'UNION' in query['sql']])
+
+    def test_lowering_amount_clears_success(self):
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 2), amount_achieved=8)
+        response = self.client.put(self.url, {'amount_achieved': 2}, format='json')
+        self.assertFalse(response.data['success'])
+        self.habit.refresh_from_db()
+        self.assertFalse(self.habit.success)
+
+    def test_invalidates_cached_reads(self):
+        detail = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+        etag = self.client.get(detail)['ETag']
+        self.client.put(self.url, {'amount_achieved': 1}, format='json')
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rejects_other_users_and_bad_input(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.put(self.url, {'amount_achieved': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.put(self.url, {'amount_achieved': -1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        url = reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': '2024-13-40'})
+        response = self.client.put(url, {'amount_achieved': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DailyRecord.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent connections')
+class ConcurrentRecordUpsertTests(TransactionTestCase):
+    def test_concurrent_increments(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        habit = Habit.objects.create(user=user, name='Water', description='Test', target=50, unit='glasses')
+
+        def work():
+            try:
+                for _ in range(10):
+                    log_record(habit.pk, user.pk, date(2024, 1, 2), 1, increment=True)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(DailyRecord.objects.get().amount_achieved, 60)
+        habit.refresh_from_db()
+        self.assertTrue(habit.success)
+        stats = HabitStats.objects.get(habit=habit)
+        self.assertEqual((stats.count, stats.total), (1, 60))
+
+
+class DueTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.day = date(2024, 1, 2)
+        self.habits = [
+            Habit.objects.create(user=self.user, name=f'Habit {i}', description='Test', target=5, unit='times')
+            for i in range(3)
+        ]
+        self.foreign = Habit.objects.create(user=self.other, name='Other', description='Test', target=5, unit='times')
+        DailyRecord.objects.create(habit=self.habits[0], date=self.day, amount_achieved=5)
+        DailyRecord.objects.create(habit=self.habits[1], date=self.day, amount_achieved=2)
+        DailyRecord.objects.create(habit=self.habits[2], date=date(2024, 1, 1), amount_achieved=5)
+
+    def test_endpoint_lists_due_habits(self):
+        url = reverse('habit-due')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'date': '2024-01-02'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'id': self.habits[1].pk, 'name': 'Habit 1', 'target': 5, 'unit': 'times', 'amount_achieved': 2},
+            {'id': self.habits[2].pk, 'name': 'Habit 2', 'target': 5, 'unit': 'times', 'amount_achieved': None},
+        ])
+        response = self.client.get(url, {'date': '2024-01-02', 'page_size': 1})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.habits[1].pk])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [self.habits[2].pk])
+        response = self.client.get(url, {'date': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command_stores_rows_per_chunk(self):
+        DueHabit.objects.create(date=self.day, user=self.user, habit=self.habits[0], target=5)
+        out = StringIO()
+        call_command('compute_due', '--date', '2024-01-02', '--chunk-size', '1', '-v', '2', stdout=out)
+        self.assertIn('Stored 3 due habits for 2024-01-02.', out.getvalue())
+        rows = DueHabit.objects.order_by('habit_id').values_list('date', 'user_id', 'habit_id', 'target', 'amount_achieved')
+        expected = [
+            (self.day, self.user.pk, self.habits[1].pk, 5, 2),
+            (self.day, self.user.pk, self.habits[2].pk, 5, None),
+            (self.day, self.other.pk, self.foreign.pk, 5, None),
+        ]
+        self.assertEqual(list(rows), expected)
+
+        # Reruns replace the day's rows instead of adding to them.
+        DailyRecord.objects.create(habit=self.foreign, date=self.day, amount_achieved=9)
+        call_command('compute_due', '--date', '2024-01-02', stdout=StringIO())
+        self.assertEqual(list(rows.all()), expected[:2])
+
+    def test_command_rejects_bad_options(self):
+        with self.assertRaises(CommandError):
+            call_command('compute_due', '--date', '2024-02-30', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('compute_due', '--workers', '0', stdout=StringIO())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs a database other processes can see')
+class ParallelDueTests(TransactionTestCase):
+    def test_workers(self):
+        users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(4)]
+        for user in users:
+            habit = Habit.objects.create(user=user, name='Water', description='Test', target=5, unit='glasses')
+            DailyRecord.objects.create(habit=habit, date=date(2024, 1, 2), amount_achieved=user.pk % 2 * 5)
+        call_command('compute_due', '--date', '2024-01-02', '--chunk-size', '1', '--workers', '2', stdout=StringIO())
+        self.assertEqual(
+            sorted(DueHabit.objects.values_list('user_id', flat=True)),
+            [user.pk for user in users if user.pk % 2 == 0],
+        )
+
+
+class SuccessRecomputeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.habits = [
+            Habit.objects.create(
+                user=self.user,
+                name=f'Habit {i}',
+                description='Test',
+                target=5,
+                unit='times'
+            )
+            for i in range(3)
+        ]
+        DailyRecord.objects.create(habit=self.habits[0], date=date(2024, 1, 1), amount_achieved=5)
+        DailyRecord.objects.create(habit=self.habits[1], date=date(2024, 1, 1), amount_achieved=3)
+
+    def test_command_fixes_stale_flags(self):
+        Habit.objects.update(success=True)
+        HabitStats.objects.update(success=True)
+        with self.assertNumQueries(1 + 2 * 3 * 2):
+            call_command('recompute_success', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(
+            list(Habit.objects.order_by('id').values_list('success', flat=True)),
+            [True, False, False]
+        )
+        self.assertEqual(
+            list(HabitStats.objects.order_by('habit_id').values_list('success', flat=True)),
+            [True, False, False]
+        )
+
+    def test_target_change_reevaluates_success(self):
+        habit = Habit.objects.get(pk=self.habits[1].pk)
+        habit.target = 3
+        habit.save()
+        self.assertTrue(habit.success)
+        self.assertTrue(Habit.objects.get(pk=habit.pk).success)
+        self.assertEqual(habit.stats.longest_streak, 1)
+
+        habit.target = 10
+        habit.save()
+        self.assertFalse(Habit.objects.get(pk=habit.pk).success)
+
+    def test_target_change_with_deferred_target(self):
+        habit = Habit.objects.only('id', 'user').get(pk=self.habits[1].pk)
+        habit.target = 3
+        habit.save()
+        self.assertTrue(Habit.objects.get(pk=habit.pk).success)
+        self.assertEqual(HabitStats.objects.get(habit=habit).longest_streak, 1)
+
+        habit = Habit.objects.defer('target').get(pk=habit.pk)
+        with self.assertNumQueries(3):
+            # savepoint, the update and its release; target stays unread
+            habit.save(update_fields=['name'])
+        self.assertNotIn('target', habit.__dict__)
+
+    def test_target_change_through_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('habit-detail', kwargs={'pk': self.habits[0].pk})
+        response = client.patch(url, {'target': 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['success'])
+
+
+class AnalyticsTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Pushups',
+            description='Test',
+            target=10,
+            unit='reps'
+        )
+        self.today = date.today()
+        for day, amount in [(0, 10), (1, 12), (3, 10), (4, 10), (5, 10), (10, 4)]:
+            DailyRecord.objects.create(
+                habit=self.habit,
+                date=self.today - timedelta(days=day),
+                amount_achieved=amount
+            )
+        self.url = reverse('habit-analytics', kwargs={'pk': self.habit.pk})
+
+    def test_analytics(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['current_streak'], 2)
+        self.assertEqual(response.data['longest_streak'], 3)
+        self.assertEqual(response.data['average_7d'], 52 / 7)
+        self.assertEqual(response.data['average_30d'], 56 / 30)
+        self.assertEqual(response.data['completion_rate'], 5 / 6)
+
+    def test_analytics_cached_until_records_change(self):
+        self.client.get(self.url)
+        # Just the habit lookup; the aggregate is cached.
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+        DailyRecord.objects.filter(date=self.today - timedelta(days=10)).get().delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['completion_rate'], 1.0)
+
+    def test_stale_streak_is_not_current(self):
+        DailyRecord.objects.filter(date__gte=self.today - timedelta(days=1)).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['current_streak'], 0)
+        self.assertEqual(response.data['longest_streak'], 3)
+
+    def test_other_user_cannot_read_analytics(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SeriesTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Pushups',
+            description='Test',
+            target=10,
+            unit='reps'
+        )
+        self.other_habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        # Jan 1 2024 is a Monday; nothing is recorded in the week of Jan 15.
+        for day, amount in [(1, 10), (2, 4), (7, 12), (8, 10), (22, 3), (31, 10)]:
+            DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, day), amount_achieved=amount)
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 2, 3), amount_achieved=6)
+        DailyRecord.objects.create(habit=self.other_habit, date=date(2024, 1, 9), amount_achieved=7)
+        self.url = reverse('habit-series', kwargs={'pk': self.habit.pk})
+
+    def test_weekly_series(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'bucket': 'week', 'from': '2024-01-03', 'to': '2024-02-04'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'habit': self.habit.pk,
+            'bucket': 'week',
+            'dates': ['2024-01-01', '2024-01-08', '2024-01-15', '2024-01-22', '2024-01-29'],
+            'count': [3, 1, 0, 1, 2],
+            'total': [26, 10, 0, 3, 16],
+            'average': [26 / 3, 10.0, None, 3.0, 8.0],
+            'best': [12, 10, None, 3, 10],
+            'hits': [2, 1, 0, 0, 1],
+        })
+
+    def test_daily_series_defaults_to_last_30_days(self):
+        DailyRecord.objects.create(habit=self.habit, date=date.today(), amount_achieved=5)
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data['dates']), 30)
+        self.assertEqual(data['dates'][-1], date.today().isoformat())
+        self.assertEqual(data['total'], [0] * 29 + [5])
+
+    def test_monthly_series_reads_rollups(self):
+        params = {'bucket': 'month', 'from': '2024-01-01', 'to': '2024-03-31'}
+        expected = self.client.get(self.url, params).json()
+        self.assertEqual(expected['total'], [49, 6, 0])
+        list(compact_records(date(2024, 2, 1), 'month'))
+        self.assertEqual(self.client.get(self.url, params).json(), expected)
+
+    def test_weekly_series_reads_weekly_rollups(self):
+        params = {'bucket': 'week', 'from': '2024-01-01', 'to': '2024-02-04'}
+        expected = self.client.get(self.url, params).json()
+        list(compact_records(date(2024, 2, 1), 'week'))
+        self.assertTrue(self.habit.rollups.exists())
+        self.assertEqual(self.client.get(self.url, params).json(), expected)
+
+    def test_buckets_finer_than_rollups_are_unavailable(self):
+        list(compact_records(date(2024, 2, 1), 'month'))
+        data = self.client.get(self.url, {'bucket': 'week', 'from': '2024-01-03', 'to': '2024-02-11'}).json()
+        self.assertEqual(data['dates'][-2:], ['2024-01-29', '2024-02-05'])
+        # Every week of January shares the month's rollup, the week of Jan 29 too.
+        self.assertEqual(data['count'], [None] * 5 + [0])
+        self.assertEqual(data['total'], [None] * 5 + [0])
+        self.assertEqual(data['hits'], [None] * 5 + [0])
+        data = self.client.get(self.url, {'bucket': 'day', 'from': '2024-01-30', 'to': '2024-02-03'}).json()
+        self.assertEqual(data['count'], [None, None, 0, 0, 1])
+        self.assertEqual(data['best'], [None, None, None, None, 6])
+        # A range ending inside a compacted month cannot take all of it.
+        data = self.client.get(self.url, {'bucket': 'month', 'from': '2024-01-15', 'to': '2024-01-20'}).json()
+        self.assertEqual((data['dates'], data['total']), (['2024-01-01'], [None]))
+        data = self.client.get(self.url, {'bucket': 'month', 'from': '2024-01-15', 'to': '2024-02-29'}).json()
+        self.assertEqual(data['total'], [49, 6])
+
+    def test_series_for_all_habits(self):
+        url = reverse('habit-series-list')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'bucket': 'month', 'from': '2024-01-01', 'to': '2024-02-29'})
+        data = response.json()
+        self.assertEqual(data['habits'], [self.habit.pk, self.other_habit.pk])
+        self.assertEqual(data['dates'], ['2024-01-01', '2024-02-01'])
+        self.assertEqual(data['total'], [[49, 6], [7, 0]])
+        self.assertEqual(data['hits'], [[4, 0], [1, 0]])
+
+    def test_invalid_parameters(self):
+        for params in [
+            {'bucket': 'year'},
+            {'from': '2024-02-01', 'to': '2024-01-01'},
+            {'bucket': 'day', 'from': '2000-01-01', 'to': '2024-01-01'},
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_user_cannot_read_series(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('habit-series-list')).json()['habits'], [])
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        self.detail_url = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+
+    def test_unchanged_list_returns_304_without_queries(self):
+        # Details still check that the object is the user's own.
+        for url, queries in ((reverse('habit-list'), 0), (self.detail_url, 1), (reverse('dailyrecord-list'), 0)):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('Last-Modified', response)
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_record_write_changes_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        DailyRecord.objects.create(habit=self.habit, date=date.today(), amount_achieved=1)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['daily_records']), 1)
+
+    def test_habit_update_changes_list_etag(self):
+        list_url = reverse('habit-list')
+        etag = self.client.get(list_url)['ETag']
+        self.client.patch(self.detail_url, {'name': 'Writing'}, format='json')
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_version_markers_are_not_culled(self):
+        # More markers than the cache backend's default MAX_ENTRIES of 300.
+        pks = range(10 ** 6, 10 ** 6 + 400)
+        versions = [get_version('habit', pk) for pk in pks]
+        self.assertEqual([get_version('habit', pk) for pk in pks], versions)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get(reverse('habit-list'))['ETag']
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('habit-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_or_foreign_object_is_not_found(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        other_habit = Habit.objects.create(user=other, name='Other', description='Test', target=1, unit='times')
+        record = DailyRecord.objects.create(habit=other_habit, date=date(2024, 1, 1), amount_achieved=1)
+        for url in (
+            reverse('habit-detail', kwargs={'pk': other_habit.pk}),
+            reverse('habit-detail', kwargs={'pk': other_habit.pk + 1}),
+            reverse('habit-series', kwargs={'pk': other_habit.pk}),
+            reverse('dailyrecord-detail', kwargs={'pk': record.pk}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_modified_since_is_ignored(self):
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('dailyrecord-list')
+
+    def test_repeat_requests_skip_token_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cache_holds_no_user_data(self):
+        self.client.get(self.url)
+        entry_key, version_key = token_cache_keys(self.token.key)
+        token_cache = caches[TOKEN_CACHE_ALIAS]
+        self.assertEqual(token_cache.get(entry_key), (token_cache.get(version_key), self.user.pk, True))
+        # The rest of the user is loaded by pk when needed.
+        response = self.client.get('/auth/users/me/')
+        self.assertEqual(response.data['username'], 'testuser')
+
+    def test_token_revoked_during_lookup_is_not_cached(self):
+        lookup = TokenAuthentication.authenticate_credentials
+
+        def lookup_then_logout(authentication, key):
+            result = lookup(authentication, key)
+            # Another request logs out between the read and the cache write.
+            Token.objects.filter(key=key).delete()
+            return result
+
+        with mock.patch.object(TokenAuthentication, 'authenticate_credentials', lookup_then_logout):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get(self.url)
+        response = self.client.post('/auth/token/logout/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_invalidates_cached_token(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deletion_invalidates_cached_token(self):
+        self.client.get(self.url)
+        self.user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(HABIT_READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def route(self, method, pin=False):
+        def get_response(request):
+            if pin:
+                pin_primary()
+            return HttpResponse(router.db_for_read(Habit))
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(getattr(RequestFactory(), method)('/habits/')).content.decode()
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.route('get'), 'replica')
+        self.assertEqual(self.route('post'), 'default')
+        self.assertEqual(self.route('patch'), 'default')
+        self.assertEqual(self.route('get', pin=True), 'default')
+        # The pin ends with the request.
+        self.assertEqual(self.route('get'), 'replica')
+
+    def test_primary_only_reads(self):
+        token = read_alias.set('replica')
+        try:
+            self.assertEqual(router.db_for_read(Habit), 'replica')
+            self.assertEqual(router.db_for_read(Token), 'default')
+            with override_settings(HABIT_READ_REPLICAS=[]):
+                self.assertEqual(router.db_for_read(Habit), 'default')
+        finally:
+            read_alias.reset(token)
+        # Outside requests, e.g. in management commands.
+        self.assertEqual(router.db_for_read(Habit), 'default')
+        self.assertEqual(router.db_for_write(Habit), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'habit'))
+
+    def test_wrote_recently(self):
+        cache.set(version_key('user', 0), f'{time.time() - 60:.6f}-old', None)
+        self.assertFalse(wrote_recently(0))
+        cache.set(version_key('user', 0), new_version(), None)
+        self.assertTrue(wrote_recently(0))
+
+
+@skipUnless(settings.HABIT_READ_REPLICAS, 'needs POSTGRES_REPLICA_HOSTS or SQLITE_REPLICAS')
+@override_settings(HABIT_READ_REPLICAS=settings.HABIT_READ_REPLICAS[:1])
+class ReplicaReadTests(TransactionTestCase):
+    databases = {'default', *settings.HABIT_READ_REPLICAS}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, name='Water', description='Test', target=8, unit='glasses')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.forget_writes()
+        self.stop_replication()
+
+    def stop_replication(self):
+        # From here on the replica lags behind the primary: an SQLite replica
+        # is a copy of it, a mirrored Postgres one keeps reading a snapshot.
+        replica = settings.HABIT_READ_REPLICAS[0]
+        if connections[replica].vendor == 'sqlite':
+            copy_primary(replica)
+            return
+        snapshot = transaction.atomic(using=replica)
+        snapshot.__enter__()
+        self.addCleanup(snapshot.__exit__, None, None, None)
+        with connections[replica].cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute(f'SELECT 1 FROM {DailyRecord._meta.db_table} LIMIT 1')
+
+    def forget_writes(self):
+        cache.set(version_key('user', self.user.pk), f'{time.time() - 60:.6f}-old', None)
+
+    def queries(self, method, url, data=None):
+        replica = settings.HABIT_READ_REPLICAS[0]
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[replica]) as replicated:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replicated)
+
+    def test_reads_your_writes(self):
+        url = reverse('habit-list')
+        self.assertEqual(self.queries('get', url), (0, 2))
+        # The write and its signal receivers stay on the primary ...
+        record_url = reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': '2024-01-02'})
+        primary, replicated = self.queries('put', record_url, {'amount_achieved': 9})
+        self.assertEqual(replicated, 0)
+        # ... and so do this user's reads for HABIT_REPLICA_PIN_SECONDS.
+        self.assertEqual(self.queries('get', url), (2, 0))
+        self.forget_writes()
+        self.assertEqual(self.queries('get', url), (0, 2))
+
+    def test_pinned_reads_see_rows_missing_on_the_replica(self):
+        record_url = reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': date.today().isoformat()})
+        self.client.put(record_url, {'amount_achieved': 9}, format='json')
+        replica = settings.HABIT_READ_REPLICAS[0]
+        self.assertFalse(DailyRecord.objects.using(replica).exists())
+        url = reverse('dailyrecord-list')
+        self.assertEqual([row['amount_achieved'] for row in self.client.get(url).data['results']], [9])
+        self.forget_writes()
+        self.assertEqual(self.client.get(url).data['results'], [])
+
+    @override_settings(HABIT_REPLICA_PIN_SECONDS=0)
+    def test_lagging_replica_reads_get_no_etag_or_cache_entry(self):
+        record_url = reverse('habit-record', kwargs={'pk': self.habit.pk, 'day': date.today().isoformat()})
+        self.client.put(record_url, {'amount_achieved': 9}, format='json')
+        url = reverse('habit-list')
+        analytics_url = reverse('habit-analytics', kwargs={'pk': self.habit.pk})
+        key = f'habit:analytics:{self.habit.pk}:{get_version("habit", self.habit.pk)}:{date.today().isoformat()}'
+
+        # The replica misses the record, so its body must not carry the new version.
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['daily_records'], [])
+        self.assertNotIn('ETag', response)
+        self.client.get(analytics_url)
+        self.assertIsNone(cache.get(key))
+
+        with override_settings(HABIT_REPLICA_MAX_LAG_SECONDS=0):
+            self.assertIn('ETag', self.client.get(url))
+            self.client.get(analytics_url)
+            self.assertIsNotNone(cache.get(key))
+
+
+class AsyncReadURLConf:
+    urlpatterns = async_read_urlpatterns + [
+        path('', include('habit.urls')),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncReadURLConf)
+class AsyncReadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        self.record = DailyRecord.objects.create(habit=self.habit, date=date.today(), amount_achieved=6)
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    async def test_async_list_matches_sync_view(self):
+        response = await self.async_client.get(reverse('habit-list'), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['user'], 'testuser')
+        self.assertEqual(results[0]['daily_records'][0]['amount_achieved'], 6)
+        self.assertEqual(results[0]['total'], 6)
+
+        response = await self.async_client.get(reverse('dailyrecord-list'), headers=self.headers)
+        self.assertEqual(response.json()['results'][0]['target'], 5)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    async def test_async_retrieve(self):
+        url = reverse('dailyrecord-detail', kwargs={'pk': self.record.pk})
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['unit'], 'pages')
+
+        response = await self.async_client.get(url, headers=self.headers, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_async_errors(self):
+        response = await self.async_client.get(reverse('habit-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        other_token = await Token.objects.acreate(user=self.other_user)
+        url = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+        response = await self.async_client.get(url, headers={'Authorization': f'Token {other_token.key}'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.get(url, headers={'Authorization': f'Token {other_token.key}'}, if_none_match='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_header_and_version_checks(self):
+        url = reverse('habit-list')
+        for authorization in ('Token', 'Token a b'):
+            response = await self.async_client.get(url, headers={'Authorization': authorization})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertIn('Invalid token header', response.json()['detail'])
+
+        class Versioning(AcceptHeaderVersioning):
+            allowed_versions = {'1'}
+
+        with mock.patch.object(HabitViewSet, 'versioning_class', Versioning):
+            response = await self.async_client.get(url, headers={**self.headers, 'Accept': 'application/json; version=2'})
+            self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+            response = await self.async_client.get(url, headers={**self.headers, 'Accept': 'application/json; version=1'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(HABIT_ASYNC_READS=True)
+    async def test_export_streams_asynchronously(self):
+        response = await self.async_client.get(reverse('habit-export'), {'type': 'ndjson'}, headers=self.headers)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([json.loads(line)['type'] for line in content.splitlines()], ['habit', 'record'])
+
+    async def test_writes_use_sync_view(self):
+        url = reverse('habit-detail', kwargs={'pk': self.habit.pk})
+        response = await self.async_client.patch(url, {'name': 'Writing'}, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((await Habit.objects.aget(pk=self.habit.pk)).name, 'Writing')
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Read, "daily"',
+            target=5,
+            unit='pages'
+        )
+        self.empty_habit = Habit.objects.create(
+            user=self.user,
+            name='Empty',
+            description='Test',
+            target=1,
+            unit='times'
+        )
+        for day in (2, 1):
+            DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, day), amount_achieved=day)
+        self.url = reverse('habit-export')
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(self.read(response))))
+        self.assertEqual(rows[0][:2], ['habit_id', 'habit_name'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][2], 'Read, "daily"')
+        self.assertEqual([row[7] for row in rows[1:3]], ['2024-01-01', '2024-01-02'])
+        self.assertEqual(rows[3][1:2] + rows[3][6:], ['Empty', '', '', ''])
+
+    def test_ndjson_export(self):
+        response = self.client.get(self.url, {'type': 'ndjson'})
+        lines = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['habit', 'record', 'record', 'habit'])
+        self.assertEqual(lines[1], {
+            'type': 'record',
+            'id': DailyRecord.objects.get(date=date(2024, 1, 1)).pk,
+            'habit': self.habit.pk,
+            'date': '2024-01-01',
+            'amount_achieved': 1,
+        })
+
+    def test_export_is_per_user(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        rows = list(csv.reader(StringIO(self.read(self.client.get(self.url)))))
+        self.assertEqual(len(rows), 1)
+
+    def test_unknown_type(self):
+        response = self.client.get(self.url, {'type': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(
+            user=self.user,
+            name='Reading',
+            description='Test',
+            target=5,
+            unit='pages'
+        )
+        DailyRecord.objects.create(habit=self.habit, date=date(2024, 1, 1), amount_achieved=1)
+        self.url = reverse('dailyrecord-import')
+
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode())
+        url = self.url + ('?type=' + params['type'] if params else '')
+        return self.client.post(url, {'file': upload}, format='multipart')
+
+    def test_csv_import(self):
+        content = (
+            'habit,date,amount_achieved\n'
+            f'{self.habit.pk},2024-01-01,6\n'
+            f'{self.habit.pk},2024-01-02,3\n'
+            f'{self.habit.pk},2024-01-02,7\n'
+        )
+        response = self.upload('records.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'records': 2, 'habits': 1})
+        self.assertEqual(
+            list(DailyRecord.objects.order_by('date').values_list('amount_achieved', flat=True)),
+            [6, 7]
+        )
+        self.habit.refresh_from_db()
+        self.assertTrue(self.habit.success)
+        stats = HabitStats.objects.get(habit=self.habit)
+        self.assertEqual((stats.count, stats.total, stats.longest_streak), (2, 13, 2))
+
+    def test_export_round_trip(self):
+        exported = b''.join(self.client.get(reverse('habit-export'), {'type': 'ndjson'}).streaming_content)
+        DailyRecord.objects.update(amount_achieved=0)
+        response = self.upload('history', exported.decode(), type='ndjson')
+        self.assertEqual(response.data, {'records': 1, 'habits': 1})
+        self.assertEqual(DailyRecord.objects.get().amount_achieved, 1)
+
+    def test_rejects_foreign_habits(self):
+        other_habit = Habit.objects.create(
+            user=self.other_user,
+            name='Other',
+            description='Test',
+            target=1,
+            unit='times'
+        )
+        content = f'habit,date,amount_achieved\n{other_habit.pk},2024-01-01,1\n'
+        response = self.upload('records.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(DailyRecord.objects.filter(habit=other_habit).exists())
+
+    def test_invalid_row(self):
+        content = f'habit,date,amount_achieved\n{self.habit.pk},2024-01-02,7\n{self.habit.pk},yesterday,1\n'
+        response = self.upload('records.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Line 3', response.data['file'][0])
+        self.assertEqual(DailyRecord.objects.count(), 1)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as f:
+            f.write(json.dumps({'habit': self.habit.pk, 'date': '2024-01-03', 'amount_achieved': 5}) + '\n')
+            f.flush()
+            out = StringIO()
+            call_command('import_records', f.name, user='testuser', stdout=out)
+            self.assertIn('Imported 1 records into 1 habits.', out.getvalue())
+            with self.assertRaises(CommandError):
+                call_command('import_records', f.name, user='otheruser', stdout=StringIO())
+        self.assertEqual(DailyRecord.objects.count(), 2)
+
+    # copy_import runs here on any backend; only the COPY load is Postgres-only.
+    def test_staged_import_merges_latest_rows(self):
+        other_habit = Habit.objects.create(user=self.other_user, name='Other', description='Test', target=1, unit='times')
+        rows = [
+            (self.habit.pk, date(2024, 1, 2), 3),
+            (self.habit.pk, date(2024, 1, 1), 6),
+            (self.habit.pk, date(2024, 1, 2), 7),
+            (other_habit.pk, date(2024, 1, 1), 1),
+        ]
+        count, habit_ids, user_ids = copy_import(connection, rows, None)
+        self.assertEqual(count, 3)
+        self.assertEqual(habit_ids, [self.habit.pk, other_habit.pk])
+        self.assertEqual(sorted(user_ids), [self.user.pk, self.other_user.pk])
+        self.assertEqual(
+            list(DailyRecord.objects.filter(habit=self.habit).order_by('date').values_list('amount_achieved', flat=True)),
+            [6, 7]
+        )
+        # The staging table is dropped, so a second import can create it.
+        self.assertEqual(copy_import(connection, rows[:1], self.user)[0], 1)
+
+    def test_staged_import_rejects_foreign_habits(self):
+        other_habit = Habit.objects.create(user=self.other_user, name='Other', description='Test', target=1, unit='times')
+        for habit_id in (other_habit.pk, other_habit.pk + 1):
+            with self.assertRaisesMessage(ForeignHabits, f'Habit {habit_id} '):
+                with transaction.atomic():
+                    copy_import(connection, [(self.habit.pk, date(2024, 1, 2), 1), (habit_id, date(2024, 1, 2), 1)], self.user)
+        self.assertEqual(DailyRecord.objects.count(), 1)
+
+    def test_staged_import_rejects_compacted_dates(self):
+        list(compact_records(date(2024, 2, 1), 'month'))
+        with self.assertRaisesMessage(ImportFailed, 'records up to 2024-01-31 are compacted'):
+            with transaction.atomic():
+                copy_import(connection, [(self.habit.pk, date(2024, 1, 5), 1)], self.user)
+        self.assertEqual(copy_import(connection, [(self.habit.pk, date(2024, 2, 1), 1)], self.user)[0], 1)
@@ -1,9 +1,27 @@
+from django.conf import settings
+from django.urls import path
 from rest_framework import routers
 from .views import HabitViewSet,DailyRecordViewSet
+from .async_views import async_read_view
 
 router = routers.DefaultRouter()
 
 router.register('habits',HabitViewSet,basename='habit')
 router.register('daily-records',DailyRecordViewSet,basename='dailyrecord')
 
-urlpatterns = router.urls
\ No newline at end of file
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+# Same routes as the router, with list/retrieve served by async views; used
+# when the app runs under ASGI (HABIT_ASYNC_READS).
+async_read_urlpatterns = [
+    path('habits/', async_read_view(HabitViewSet, LIST_ACTIONS, detail=False), name='habit-list'),
+    path('habits/<int:pk>/', async_read_view(HabitViewSet, DETAIL_ACTIONS, detail=True), name='habit-detail'),
+    path('daily-records/', async_read_view(DailyRecordViewSet, LIST_ACTIONS, detail=False), name='dailyrecord-list'),
+    path('daily-records/<int:pk>/', async_read_view(DailyRecordViewSet, DETAIL_ACTIONS, detail=True), name='dailyrecord-detail'),
+]
+
+urlpatterns = router.urls
+
+if settings.HABIT_ASYNC_READS:
+    urlpatterns = async_read_urlpatterns + urlpatterns
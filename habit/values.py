@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .metrics import measure_serialization
+from .serializers import HabitSerializer, DailyRecordSerializer
+
+
+class ValuesSerializer:
+    # Read-only twin of a ModelSerializer for list responses. Rows come from
+    # .values() and every field has a precomputed (name, key, converter)
+    # extractor, so no model instances or DRF fields are built per row.
+    # The representation must stay identical to serializer_class.
+    serializer_class = None
+    lookups = {}
+    converters = {}
+    required = ('id',)
+
+    def __init__(self, fields=None):
+        names = [
+            name for name in self.serializer_class.Meta.fields
+            if fields is None or name in fields
+        ]
+        self.extractors = [(name, self.key(name), self.converters.get(name)) for name in names]
+
+    def key(self, name):
+        return self.lookups.get(name, name)
+
+    def get_queryset(self, queryset):
+        keys = dict.fromkeys([*self.required, *(key for _, key, _ in self.extractors)])
+        return queryset.prefetch_related(None).values(*keys)
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        extractors = self.extractors
+        data = []
+        with measure_serialization():
+            for row in rows:
+                item = {}
+                for name, key, convert in extractors:
+                    value = row[key]
+                    item[name] = value if convert is None or value is None else convert(value)
+                data.append(item)
+        return data
+
+
+class HabitValuesSerializer(ValuesSerializer):
+    serializer_class = HabitSerializer
+    lookups = {
+        'user': 'user__username',
+        'daily_records': 'id',
+        'total': 'stats__total',
+        'average': 'stats__average',
+        'best': 'stats__best',
+    }
+
+    def __init__(self, fields=None, records=None):
+        self.converters = {'daily_records': self.daily_records_for}
+        self.records = records
+        self.page_records = {}
+        super().__init__(fields)
+
+    def to_representation(self, rows):
+        if any(name == 'daily_records' for name, _, _ in self.extractors):
+            self.page_records = self.fetch_records([row['id'] for row in rows])
+        return super().to_representation(rows)
+
+    def fetch_records(self, habit_ids):
+        # One query for the page, same window as the prefetch in HabitViewSet.
+        records = defaultdict(list)
+        rows = self.records.filter(habit_id__in=habit_ids).values_list('habit_id', 'id', 'date', 'amount_achieved')
+        for habit_id, record_id, day, amount in rows:
+            records[habit_id].append({'id': record_id, 'date': day, 'amount_achieved': amount})
+        return records
+
+    def daily_records_for(self, habit_id):
+        return self.page_records.get(habit_id, [])
+
+
+class DailyRecordValuesSerializer(ValuesSerializer):
+    serializer_class = DailyRecordSerializer
+    lookups = {
+        'target': 'habit__target',
+        'unit': 'habit__unit',
+    }
+    converters = {
+        'date': serializers.DateField().to_representation,
+    }
+    required = ('id', 'date')
+
+
+class ValuesListMixin:
+    # Serves list() (and the async alist()) through get_values_serializer();
+    # retrieve and writes keep using serializer_class.
+
+    def get_values_serializer(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_values_serializer()
+        queryset = serializer.get_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(serializer.to_representation(queryset))
+        return self.get_paginated_response(serializer.to_representation(page))
+
+    async def alist(self, request, *args, **kwargs):
+        serializer = self.get_values_serializer()
+        queryset = serializer.get_queryset(self.filter_queryset(self.get_queryset()))
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        data = await sync_to_async(serializer.to_representation)(page)
+        return self.get_paginated_response(data)
@@ -1,44 +1,278 @@
-from django.db.models import Prefetch, Avg, Max,Sum
-from rest_framework import viewsets
-from rest_framework.exceptions import PermissionDenied
+import io
+import os
+from functools import cached_property
+
+from django.db import router
+from django.db.models import Prefetch, F, Max, Window
+from django.db.models.functions import RowNumber
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from .models import Habit,DailyRecord
-from .serializers import HabitSerializer,DailyRecordSerializer
+from .serializers import HabitSerializer,DailyRecordSerializer,DailyRecordBulkSerializer,RecordsWindowSerializer,HabitFieldsSerializer,SeriesSerializer,RecordAmountSerializer,RecordIncrementSerializer,DueSerializer
 from .permissions import IsOwner
+from .pagination import HabitPagination,DailyRecordPagination
+from .services import log_record, upsert_records
+from .rollups import CompactedHistory, reject_compacted
+from .stats import compute_analytics
+from .series import METRICS, build_series
+from .due import due_habits
+from .conditional import ConditionalGetMixin
+from .async_views import AsyncReadMixin
+from .replicas import ReadYourWritesMixin
+from .values import ValuesListMixin, HabitValuesSerializer, DailyRecordValuesSerializer
+from .export import ENCODERS, astream_export, stream_export
+from .importing import PARSERS, ForeignHabits, ImportFailed, import_records
 
-class HabitViewSet(viewsets.ModelViewSet):
+class HabitViewSet(ReadYourWritesMixin, ConditionalGetMixin, ValuesListMixin, AsyncReadMixin, viewsets.ModelViewSet):
     serializer_class = HabitSerializer
     permission_classes = [IsAuthenticated,IsOwner]
+    pagination_class = HabitPagination
 
-    def get_queryset(self):
-        daily_records_prefetch = Prefetch(
+    def get_version_scope(self):
+        if self.action in ('retrieve', 'series'):
+            return 'habit', self.kwargs['pk']
+        return super().get_version_scope()
+
+    def get_daily_records_queryset(self):
+        window = RecordsWindowSerializer(data=self.request.query_params)
+        window.is_valid(raise_exception=True)
+        params = window.validated_data
+
+        records = DailyRecord.objects.filter(date__gte=params['records_from'])
+        if 'records_to' in params:
+            records = records.filter(date__lte=params['records_to'])
+        # Only the newest records_limit rows per habit leave the database.
+        records = records.annotate(
+            row_number=Window(RowNumber(), partition_by=F('habit_id'), order_by=F('date').desc())
+        ).filter(row_number__lte=params['records_limit'])
+        return records.only('id', 'habit_id', 'date', 'amount_achieved',).order_by('date')
+
+    def get_daily_records_prefetch(self):
+        return Prefetch(
             'daily_records',
-            queryset=DailyRecord.objects.only('id', 'date', 'amount_achieved',),
+            queryset=self.get_daily_records_queryset(),
             to_attr='prefetched_daily_records'
         )
-        return Habit.objects.filter(user=self.request.user).prefetch_related(daily_records_prefetch).annotate(
-            average = Avg('daily_records__amount_achieved'),
-            total = Sum(('daily_records__amount_achieved')),
-            best = Max(('daily_records__amount_achieved'))
-        )
+
+    @cached_property
+    def habit_fields(self):
+        if self.action not in ('list', 'retrieve'):
+            return None
+        params = HabitFieldsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data['fields']
+
+    def get_queryset(self):
+        if self.action == 'analytics':
+            return Habit.objects.filter(user=self.request.user).select_related('stats')
+        if self.action in ('series', 'series_list'):
+            return Habit.objects.filter(user=self.request.user).only('id', 'user')
+        fields = self.habit_fields
+        if fields is None:
+            daily_records_prefetch = self.get_daily_records_prefetch()
+            return Habit.objects.filter(user=self.request.user).prefetch_related(daily_records_prefetch).select_related('stats', 'user')
+
+        # Only the requested columns, joins and prefetches.
+        columns = ['id', 'user', *fields & {'name', 'description', 'target', 'unit', 'success'}]
+        queryset = Habit.objects.filter(user=self.request.user)
+        if 'user' in fields:
+            queryset = queryset.select_related('user')
+            columns.append('user__username')
+        if fields & set(HabitSerializer.EXPANSIONS['stats']):
+            queryset = queryset.select_related('stats')
+            columns.append('stats')
+        if 'daily_records' in fields:
+            queryset = queryset.prefetch_related(self.get_daily_records_prefetch())
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.habit_fields is not None:
+            kwargs.setdefault('fields', self.habit_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_values_serializer(self):
+        fields = self.habit_fields
+        records = None
+        if fields is None or 'daily_records' in fields:
+            records = self.get_daily_records_queryset()
+        return HabitValuesSerializer(fields, records=records)
 
     def perform_create(self, serializer):
         serializer.save(user = self.request.user)
 
-class DailyRecordViewSet(viewsets.ModelViewSet):
+    @action(detail=True)
+    def analytics(self, request, pk=None):
+        return Response(compute_analytics(self.get_object()))
+
+    def get_series_params(self):
+        params = SeriesSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data
+
+    @action(detail=True)
+    def series(self, request, pk=None):
+        return self.conditional_response(self.habit_series, request)
+
+    def habit_series(self, request):
+        params = self.get_series_params()
+        habit = self.get_object()
+        dates, columns = build_series([habit.pk], **params)
+        return Response({'habit': habit.pk, 'bucket': params['bucket'], 'dates': dates, **columns[habit.pk]})
+
+    @action(detail=False, url_path='series', url_name='series-list')
+    def series_list(self, request):
+        return self.conditional_response(self.user_series, request)
+
+    def user_series(self, request):
+        # Same arrays per metric, one row per habit in the order of `habits`.
+        params = self.get_series_params()
+        habit_ids = list(self.get_queryset().order_by('id').values_list('id', flat=True))
+        dates, columns = build_series(habit_ids, **params)
+        data = {'habits': habit_ids, 'bucket': params['bucket'], 'dates': dates}
+        for metric in METRICS:
+            data[metric] = [columns[habit_id][metric] for habit_id in habit_ids]
+        return Response(data)
+
+    @action(detail=False)
+    def due(self, request):
+        return self.conditional_response(self.user_due, request)
+
+    def user_due(self, request):
+        # One anti-join against the day's records, paged by habit id.
+        params = DueSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        rows = due_habits(params.validated_data['date']).filter(user=request.user).values(
+            'id', 'name', 'target', 'unit', amount_achieved=F('today__amount_achieved'),
+        )
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(page)
+
+    @action(detail=True, methods=['put'], url_path=r'records/(?P<day>[0-9-]+)', url_name='record')
+    def record(self, request, pk=None, day=None):
+        amount = self.get_record_data(RecordAmountSerializer)['amount_achieved']
+        return self.log_record(pk, day, amount)
+
+    @action(detail=True, methods=['post'], url_path=r'records/(?P<day>[0-9-]+)/increment', url_name='record-increment')
+    def increment_record(self, request, pk=None, day=None):
+        amount = self.get_record_data(RecordIncrementSerializer)['amount']
+        return self.log_record(pk, day, amount, increment=True)
+
+    def get_record_data(self, serializer_class):
+        serializer = serializer_class(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def log_record(self, pk, day, amount, increment=False):
+        # Ownership is checked inside the upsert statement, not via get_object().
+        try:
+            day = serializers.DateField().to_internal_value(day)
+        except serializers.ValidationError as exc:
+            raise ValidationError({'date': exc.detail})
+        try:
+            record = log_record(int(pk), self.request.user.pk, day, amount, increment=increment) if pk.isdigit() else None
+        except CompactedHistory as exc:
+            raise ValidationError({'date': [str(exc)]})
+        if record is None:
+            raise NotFound()
+        return Response(record)
+
+    @action(detail=False)
+    def export(self, request):
+        export_type = request.query_params.get('type', 'csv')
+        if export_type not in ENCODERS:
+            raise ValidationError({'type': [f'Choose one of: {", ".join(ENCODERS)}.']})
+        encoder = ENCODERS[export_type]()
+        # ASGI servers need an async iterator to stream without buffering.
+        stream = astream_export if settings.HABIT_ASYNC_READS else stream_export
+        # The rows are read after the response has left the middleware, so
+        # the database is chosen now.
+        using = router.db_for_read(Habit)
+        response = StreamingHttpResponse(stream(request.user, encoder, using), content_type=encoder.content_type)
+        response['Content-Disposition'] = f'attachment; filename="habits.{encoder.extension}"'
+        return response
+
+class DailyRecordViewSet(ReadYourWritesMixin, ConditionalGetMixin, ValuesListMixin, AsyncReadMixin, viewsets.ModelViewSet):
     serializer_class = DailyRecordSerializer
     permission_classes = [IsAuthenticated,IsOwner]
+    pagination_class = DailyRecordPagination
 
     def perform_create(self, serializer):
         habit = serializer.validated_data['habit']
-        if habit.user != self.request.user:
+        if habit.user_id != self.request.user.pk:
             raise PermissionDenied("You can only create records for your own habits.")
+        self.reject_compacted([(habit.pk, serializer.validated_data['date'])])
         serializer.save()
 
+    def perform_update(self, serializer):
+        data = serializer.validated_data
+        if 'habit' in data or 'date' in data:
+            record = serializer.instance
+            self.reject_compacted([(data.get('habit', record.habit).pk, data.get('date', record.date))])
+        serializer.save()
+
+    def reject_compacted(self, records, horizons=None):
+        try:
+            reject_compacted(records, horizons)
+        except CompactedHistory as exc:
+            raise ValidationError({'date': [str(exc)]})
+
     def get_queryset(self):
         return DailyRecord.objects.filter(habit__user=self.request.user).select_related('habit')
 
+    def get_values_serializer(self):
+        return DailyRecordValuesSerializer()
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = DailyRecordBulkSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.HABIT_BULK_MAX_RECORDS,
+        )
+        serializer.is_valid(raise_exception=True)
+        records = [
+            (item['habit'], item['date'], item['amount_achieved'])
+            for item in serializer.validated_data
+        ]
 
+        habit_ids = {habit_id for habit_id, _, _ in records}
+        # Ownership and the end of each habit's compacted history in one query.
+        owned = dict(
+            Habit.objects.filter(user=request.user, id__in=habit_ids)
+            .annotate(compacted=Max('rollups__period_end'))
+            .values_list('id', 'compacted')
+        )
+        if len(owned) != len(habit_ids):
+            raise PermissionDenied("You can only create records for your own habits.")
+        horizons = {habit_id: day for habit_id, day in owned.items() if day is not None}
+        self.reject_compacted([(habit_id, day) for habit_id, day, _ in records], horizons)
 
+        count, habit_ids = upsert_records(request.user.pk, records)
+        habits = Habit.objects.filter(id__in=habit_ids).order_by('id').values('id', 'success')
+        return Response({'count': count, 'habits': list(habits)})
 
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+        extension = os.path.splitext(upload.name)[1].lstrip('.').lower()
+        import_type = request.query_params.get('type', extension)
+        if import_type not in PARSERS:
+            raise ValidationError({'type': [f'Choose one of: {", ".join(PARSERS)}.']})
 
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            result = import_records(PARSERS[import_type](lines), user=request.user)
+        except ForeignHabits:
+            raise PermissionDenied("You can only create records for your own habits.")
+        except ImportFailed as exc:
+            raise ValidationError({'file': [str(exc)]})
+        return Response(result)